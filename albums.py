@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Сборка альбомов (media_group) из отдельных апдейтов.
+
+Telegram присылает элементы альбома отдельными сообщениями с общим
+media_group_id. AlbumAggregator копит их и отдаёт альбом в on_flush, когда
+новых элементов не было debounce секунд (таймер сдвигается с каждым
+элементом), но не позже max_wait секунд от первого элемента.
+
+Память ограничена: не больше max_items элементов в альбоме, max_albums_per_user
+незавершённых альбомов на пользователя и max_albums всего. Альбомы старше ttl
+(например, если задача сброса умерла) вычищаются. У каждого альбома своя задача
+сброса — album.task. Часы и sleep подменяются, поэтому логику можно гонять с
+фейковыми часами без реального ожидания.
+
+С supervisor (tasks.TaskSupervisor) сама отправка альбома идёт задачей
+супервизора: число одновременных отправок ограничено, а при остановке бота
+они дожидаются завершения.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from tasks import TaskSupervisor
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE = 1.0
+MAX_WAIT = 5.0
+TTL = 60.0
+MAX_ITEMS = 10
+MAX_ALBUMS_PER_USER = 2
+MAX_ALBUMS = 1000
+
+
+class PendingAlbum:
+    __slots__ = ("group_id", "user_id", "items", "caption", "meta", "first_seen", "last_seen", "task")
+
+    def __init__(self, group_id: str, user_id: int, meta: Any, now: float):
+        self.group_id = group_id
+        self.user_id = user_id
+        self.items: List[Any] = []
+        self.caption = ""
+        self.meta = meta
+        self.first_seen = now
+        self.last_seen = now
+        self.task: Optional[asyncio.Task] = None
+
+
+class AlbumAggregator:
+    def __init__(
+        self,
+        on_flush: Callable[[PendingAlbum], Awaitable[None]],
+        debounce: float = DEBOUNCE,
+        max_wait: float = MAX_WAIT,
+        ttl: float = TTL,
+        max_items: int = MAX_ITEMS,
+        max_albums_per_user: int = MAX_ALBUMS_PER_USER,
+        max_albums: int = MAX_ALBUMS,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        supervisor: Optional[TaskSupervisor] = None,
+    ):
+        self._on_flush = on_flush
+        self._supervisor = supervisor
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_albums_per_user = max_albums_per_user
+        self.max_albums = max_albums
+        self._clock = clock
+        self._sleep = sleep
+        self._albums: Dict[str, PendingAlbum] = {}
+        self._per_user: Dict[int, int] = {}
+        self.flushed = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.errors = 0
+
+    def add(self, group_id: str, user_id: int, item: Any, caption: Optional[str] = None, meta: Any = None) -> bool:
+        """
+        Добавляет элемент альбома. meta запоминается от первого элемента.
+        Возвращает False, если элемент отброшен из-за ограничений.
+        """
+        now = self._clock()
+        album = self._albums.get(group_id)
+        if album is None:
+            self.evict_expired()
+            if len(self._albums) >= self.max_albums or self._per_user.get(user_id, 0) >= self.max_albums_per_user:
+                self.rejected += 1
+                return False
+            album = PendingAlbum(group_id, user_id, meta, now)
+            self._albums[group_id] = album
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            album.task = asyncio.ensure_future(self._wait_and_flush(album))
+        if len(album.items) >= self.max_items:
+            self.rejected += 1
+            return False
+        album.items.append(item)
+        if caption:
+            album.caption = caption
+        album.last_seen = now
+        return True
+
+    def _deadline(self, album: PendingAlbum) -> float:
+        return min(album.last_seen + self.debounce, album.first_seen + self.max_wait)
+
+    async def _wait_and_flush(self, album: PendingAlbum) -> None:
+        while True:
+            delay = self._deadline(album) - self._clock()
+            if delay <= 0:
+                break
+            await self._sleep(delay)
+        await self._flush(album)
+
+    def _forget(self, album: PendingAlbum) -> bool:
+        if self._albums.get(album.group_id) is not album:
+            return False
+        del self._albums[album.group_id]
+        left = self._per_user.get(album.user_id, 1) - 1
+        if left > 0:
+            self._per_user[album.user_id] = left
+        else:
+            self._per_user.pop(album.user_id, None)
+        return True
+
+    async def _flush(self, album: PendingAlbum) -> Optional[asyncio.Task]:
+        """Убирает альбом из ожидающих и отправляет его: сразу или задачей супервизора (её и возвращает)."""
+        if not self._forget(album):
+            return None
+        if self._supervisor is not None:
+            return self._supervisor.spawn(self._deliver(album), name=f"album {album.group_id}")
+        await self._deliver(album)
+        return None
+
+    async def _deliver(self, album: PendingAlbum) -> None:
+        try:
+            await self._on_flush(album)
+            self.flushed += 1
+        except Exception:
+            self.errors += 1
+            logger.exception("Failed to flush album %s of user %s", album.group_id, album.user_id)
+
+    def evict_expired(self) -> int:
+        """Удаляет альбомы старше ttl вместе с их задачами. Возвращает число удалённых."""
+        limit = self._clock() - self.ttl
+        expired = [a for a in self._albums.values() if a.first_seen < limit]
+        for album in expired:
+            self._forget(album)
+            if album.task is not None and not album.task.done():
+                album.task.cancel()
+            logger.warning("Evicted orphaned album %s of user %s", album.group_id, album.user_id)
+        self.evicted += len(expired)
+        return len(expired)
+
+    async def flush_all(self) -> None:
+        """Немедленно сбрасывает все незавершённые альбомы (при остановке бота)."""
+        albums = list(self._albums.values())
+        for album in albums:
+            if album.task is not None and not album.task.done():
+                album.task.cancel()
+        tasks = [await self._flush(album) for album in albums]
+        await asyncio.gather(*(t for t in tasks if t is not None), return_exceptions=True)
+
+    def __len__(self) -> int:
+        return len(self._albums)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._albums),
+            "pending_items": sum(len(a.items) for a in self._albums.values()),
+            "flushed": self.flushed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "errors": self.errors,
+        }
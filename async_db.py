@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный слой доступа к БД поверх database.py.
+
+Синхронные вызовы sqlite3 выполняются в отдельных потоках, чтобы fsync или
+ожидание блокировки не останавливали event loop aiogram. Чтение идёт через
+пул потоков, запись — через один поток: SQLite всё равно пропускает только
+одного писателя, а так запросы на запись не занимают потоки читателей.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import database
+
+# По потоку на каждое соединение-читатель пула.
+READ_WORKERS = database.READ_CONNECTIONS
+
+_read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="db-read")
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+
+def _run_in(executor: ThreadPoolExecutor, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    return wrapper
+
+
+def _reader(func):
+    return _run_in(_read_executor, func)
+
+
+def _writer(func):
+    return _run_in(_write_executor, func)
+
+
+init_db = _writer(database.init_db)
+
+# Профиль из БД мимо кэша (результат кладётся в кэш)
+load_user_profile = _reader(database.load_user_profile)
+
+
+async def get_user_profile(user_id: int) -> Optional[database.UserProfile]:
+    """Попадание в кэш отдаётся сразу, без перехода в поток БД."""
+    found, profile = database.user_cache.get(user_id)
+    if found:
+        return profile
+    return await load_user_profile(user_id)
+
+
+async def user_exists(user_id: int) -> bool:
+    return await get_user_profile(user_id) is not None
+
+
+async def get_user_language(user_id: int) -> str:
+    profile = await get_user_profile(user_id)
+    return profile.language if profile else database.DEFAULT_LANGUAGE
+
+
+async def is_verification_pending(user_id: int) -> bool:
+    profile = await get_user_profile(user_id)
+    return profile.pending if profile else False
+
+
+async def is_verified(user_id: int) -> bool:
+    profile = await get_user_profile(user_id)
+    return profile.verified if profile else False
+
+
+async def get_user_info(user_id: int) -> Optional[Tuple]:
+    profile = await get_user_profile(user_id)
+    return (profile.user_id, profile.username) if profile else None
+
+
+_find_user_id_by_username = _reader(database.find_user_id_by_username)
+
+
+async def get_user_id_by_username(username: str) -> Optional[int]:
+    """Сброс write_buffer — в потоке записи, поиск — в потоке чтения."""
+    if len(database.write_buffer):
+        await flush_writes()
+    return await _find_user_id_by_username(username)
+
+def _inline(func):
+    """Запись уходит в write-behind буфер (только память), переход в поток БД не нужен."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+add_user = _writer(database.add_user)
+update_user_language = _inline(database.update_user_language)
+update_language = _inline(database.update_language)
+set_verification_pending = _inline(database.set_verification_pending)
+update_verification_status = _inline(database.update_verification_status)
+flush_writes = _writer(database.write_buffer.flush)
+
+get_fsm_state = _reader(database.get_fsm_state)
+get_fsm_data = _reader(database.get_fsm_data)
+set_fsm_state = _writer(database.set_fsm_state)
+set_fsm_data = _writer(database.set_fsm_data)
+update_fsm_data = _writer(database.update_fsm_data)
+delete_expired_fsm = _writer(database.delete_expired_fsm)
+count_fsm_states = _reader(database.count_fsm_states)
+
+submit_verification_request = _writer(database.submit_verification_request)
+record_verification_media = _writer(database.record_verification_media)
+withdraw_verification_request = _writer(database.withdraw_verification_request)
+decide_verification = _writer(database.decide_verification)
+decide_verifications = _writer(database.decide_verifications)
+list_pending_verifications = _reader(database.list_pending_verifications)
+find_verification_media = _reader(database.find_verification_media)
+list_request_media = _reader(database.list_request_media)
+reassign_stale_verifications = _writer(database.reassign_stale_verifications)
+adopt_unassigned_verifications = _writer(database.adopt_unassigned_verifications)
+moderator_stats = _reader(database.moderator_stats)
+
+
+def shutdown(wait: bool = True) -> None:
+    """Останавливает потоки БД и закрывает пул соединений. Вызывается из bot.py при завершении."""
+    _read_executor.shutdown(wait=wait)
+    _write_executor.shutdown(wait=wait)
+    database.close_db()
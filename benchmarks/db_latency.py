@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Задержка обработки апдейтов при конкурентной записи в БД.
+
+Сравнивает синхронные вызовы прямо из корутин (как было в commands.py;
+старые функции database.py с соединением на каждый вызов воспроизведены здесь
+как есть) с async_db. Параллельно отдельный поток на своём соединении
+коммитит настоящие транзакции записи в ту же базу с короткой паузой между ними. Для каждого варианта печатаются p50/p99 задержки «DB-хендлера»
+(чтение + запись) и «лёгкого» хендлера без БД — именно он показывает,
+блокируется ли event loop.
+
+    python -m benchmarks.db_latency --users 2000 --updates 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import async_db
+import database
+from benchmarks.stats import percentile
+
+# Строк в одной транзакции фонового писателя и пауза между коммитами (с)
+WRITER_BATCH = 20
+WRITER_PAUSE = 0.002
+
+
+def _legacy_get_user_language(path: str, user_id: int):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT language FROM users WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()
+    conn.close()
+    return result[0] if result else None
+
+
+def _legacy_set_verification_pending(path: str, user_id: int, pending: bool):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET verification_pending = ? WHERE user_id = ?", (1 if pending else 0, user_id))
+    conn.commit()
+    conn.close()
+
+
+def _seed(path: str, n_users: int) -> None:
+    database.init_db(path)
+    with database._get_pool().writer() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, username, language) VALUES (?, ?, 'en')",
+            ((i, f"user{i}") for i in range(1, n_users + 1)),
+        )
+
+
+def _background_writer(path: str, n_users: int, stop: threading.Event) -> None:
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        while not stop.is_set():
+            with conn:
+                conn.executemany(
+                    "UPDATE users SET verification_status = ? WHERE user_id = ?",
+                    ((random.random() < 0.5, random.randint(1, n_users)) for _ in range(WRITER_BATCH)),
+                )
+            time.sleep(WRITER_PAUSE)
+    finally:
+        conn.close()
+
+
+async def _run(mode: str, path: str, n_users: int, n_updates: int, concurrency: int) -> dict:
+    if mode == "sync":
+        async def get_lang(uid):
+            return _legacy_get_user_language(path, uid)
+
+        async def set_pending(uid, pending):
+            _legacy_set_verification_pending(path, uid, pending)
+    else:
+        get_lang = async_db.get_user_language
+        set_pending = async_db.set_verification_pending
+
+    db_lat: list[float] = []
+    light_lat: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def db_handler(uid: int, t0: float):
+        async with sem:
+            await get_lang(uid)
+            await set_pending(uid, False)
+            db_lat.append(time.perf_counter() - t0)
+
+    async def light_handler(t0: float):
+        await asyncio.sleep(0)
+        light_lat.append(time.perf_counter() - t0)
+
+    stop = threading.Event()
+    writer = threading.Thread(target=_background_writer, args=(path, n_users, stop), daemon=True)
+    writer.start()
+    started = time.perf_counter()
+    try:
+        tasks = []
+        for _ in range(n_updates):
+            now = time.perf_counter()
+            tasks.append(asyncio.create_task(db_handler(random.randint(1, n_users), now)))
+            tasks.append(asyncio.create_task(light_handler(now)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+    finally:
+        stop.set()
+        writer.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "mode": mode,
+        "updates_per_sec": n_updates / elapsed,
+        "db_p50_ms": percentile(db_lat, 0.50) * 1000,
+        "db_p99_ms": percentile(db_lat, 0.99) * 1000,
+        "light_p50_ms": percentile(light_lat, 0.50) * 1000,
+        "light_p99_ms": percentile(light_lat, 0.99) * 1000,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed(path, args.users)
+        for mode in ("sync", "async"):
+            res = asyncio.run(_run(mode, path, args.users, args.updates, args.concurrency))
+            print(
+                f"{res['mode']:>5}: {res['updates_per_sec']:8.0f} upd/s | "
+                f"db p50 {res['db_p50_ms']:7.2f} ms p99 {res['db_p99_ms']:7.2f} ms | "
+                f"light p50 {res['light_p50_ms']:7.2f} ms p99 {res['light_p99_ms']:7.2f} ms"
+            )
+        async_db.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
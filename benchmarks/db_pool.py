@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Запросов в секунду: connect-per-call (старый get_connection) против пула.
+
+Старый вариант воспроизведён здесь как есть: sqlite3.connect → execute →
+commit → close на каждый вызов, журнал по умолчанию (DELETE, synchronous=FULL).
+Пул — database.py после init_db(): WAL, synchronous=NORMAL, mmap, кэш
+подготовленных выражений. Те же SQL идут прямо через соединения пула
+(database._fetchone / database._execute), мимо кэша профилей и write-behind
+буфера, иначе замерялись бы попадания в кэш и запись в память, а не SQLite.
+
+    python -m benchmarks.db_pool --users 10000 --ops 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import database
+
+
+def _legacy_read(path: str, user_id: int):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT language FROM users WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()
+    conn.close()
+    return result
+
+
+def _legacy_write(path: str, user_id: int):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET verification_pending = ? WHERE user_id = ?", (0, user_id))
+    conn.commit()
+    conn.close()
+
+
+def _pool_read(user_id: int):
+    return database._fetchone("SELECT language FROM users WHERE user_id = ?", (user_id,))
+
+
+def _pool_write(user_id: int):
+    database._execute("UPDATE users SET verification_pending = ? WHERE user_id = ?", (0, user_id))
+
+
+def _seed(path: str, n_users: int) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE NOT NULL,
+            username TEXT,
+            language TEXT DEFAULT 'en',
+            verification_status INTEGER DEFAULT 0,
+            verification_pending INTEGER DEFAULT 0
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO users (user_id, username, language) VALUES (?, ?, 'en')",
+        ((i, f"user{i}") for i in range(1, n_users + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _qps(fn, ids: list[int]) -> float:
+    started = time.perf_counter()
+    for uid in ids:
+        fn(uid)
+    return len(ids) / (time.perf_counter() - started)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    reads = [random.randint(1, args.users) for _ in range(args.ops)]
+    # Запись в старом режиме упирается в fsync, поэтому операций меньше.
+    writes = reads[: max(1, args.ops // 20)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        pooled_path = os.path.join(tmp, "pooled.db")
+        _seed(legacy_path, args.users)
+        _seed(pooled_path, args.users)
+
+        results = {
+            "legacy read": _qps(lambda uid: _legacy_read(legacy_path, uid), reads),
+            "legacy write": _qps(lambda uid: _legacy_write(legacy_path, uid), writes),
+        }
+        database.init_db(pooled_path)
+        try:
+            results["pool read"] = _qps(_pool_read, reads)
+            results["pool write"] = _qps(_pool_write, writes)
+        finally:
+            database.close_db()
+
+    for name, qps in results.items():
+        print(f"{name:>12}: {qps:10.0f} q/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Сквозной бенчмарк: настоящий Dispatcher с роутером commands.dp и всеми его
+middleware, временная БД с N пользователями и фейковая сессия Bot API
+(ответы собираются так же, как от Telegram, и проходят обычный разбор aiogram).
+
+Апдейты — сценарии из benchmarks.telegram_fakes: /start и выбор языка, текст,
+фото, /verify с альбомом, approve/reject модератора. Апдейты одного сценария
+идут по очереди, сценарии — параллельно (--concurrency). Отчёт: апдейтов в
+секунду, p50/p99 по всем апдейтам и по типам, пиковая память, вызовы Bot API.
+--json пишет результат в файл (или "-" в stdout), чтобы сравнивать версии.
+
+    python -m benchmarks.e2e --users 2000 --scenarios 5000 --json e2e.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+import aiogram
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import TelegramMethod
+
+import async_db
+import commands
+import database
+from benchmarks.stats import percentile
+from benchmarks.telegram_fakes import BOT_TOKEN, fake_result, generate_scenarios, seed_users
+from fsm_storage import SQLiteStorage
+from middlewares import UpdateDeduplicationMiddleware
+
+
+class FakeSession(BaseSession):
+    """Сессия без сети: считает вызовы, ждёт latency секунд и отдаёт ответ из fake_result()."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1_000_000)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        name = method.__api_method__
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = fake_result(name, method.model_dump(warnings=False), next(self._message_ids))
+        response = self.check_response(bot, method, 200, json.dumps({"ok": True, "result": result}))
+        return response.result
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1e3, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1e3, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1e3, 3),
+    }
+
+
+async def _run(args) -> dict:
+    scenarios = generate_scenarios(args.scenarios, args.users, seed=args.seed)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        await async_db.init_db(os.path.join(tmp, "e2e.db"))
+        with database._get_pool().writer() as conn:
+            seed_users(conn, args.users)
+
+        storage = SQLiteStorage() if args.storage == "sqlite" else MemoryStorage()
+        dp = Dispatcher(storage=storage)
+        dedup = UpdateDeduplicationMiddleware()
+        dp.update.outer_middleware(dedup)
+        dp.include_router(commands.dp)
+        session = FakeSession(args.api_latency / 1000)
+        bot = Bot(BOT_TOKEN, session=session)
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def play(steps):
+            async with slots:
+                for kind, update in steps:
+                    started = time.perf_counter()
+                    await dp.feed_raw_update(bot, update)
+                    latencies[kind].append(time.perf_counter() - started)
+
+        if args.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(play(steps) for steps in scenarios))
+        await commands.verification_albums.flush_all()
+        elapsed = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+        if args.trace_memory:
+            tracemalloc.stop()
+
+        result = {
+            "config": {
+                "users": args.users,
+                "scenarios": args.scenarios,
+                "concurrency": args.concurrency,
+                "api_latency_ms": args.api_latency,
+                "storage": args.storage,
+                "seed": args.seed,
+                "python": platform.python_version(),
+                "aiogram": aiogram.__version__,
+            },
+            "updates": sum(len(v) for v in latencies.values()),
+            "elapsed_s": round(elapsed, 3),
+            "updates_per_s": round(sum(len(v) for v in latencies.values()) / elapsed, 1),
+            "latency": _summary([x for v in latencies.values() for x in v]),
+            "by_type": {kind: _summary(v) for kind, v in sorted(latencies.items())},
+            "api_calls": dict(sorted(session.calls.items())),
+            # ru_maxrss в Linux — в КиБ
+            "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "tracemalloc_peak_kib": traced_peak // 1024 if traced_peak is not None else None,
+            "albums": commands.verification_albums.stats(),
+            "background_tasks": commands.background_tasks.stats(),
+            "throttling": commands.throttling.stats(),
+            "update_dedup": dedup.stats(),
+            "user_cache": database.user_cache.stats(),
+            "write_buffer": database.write_buffer.stats(),
+        }
+        async_db.shutdown()
+    return result
+
+
+def _print(result: dict) -> None:
+    total = result["latency"]
+    print(
+        f"{result['updates']} updates in {result['elapsed_s']}s: {result['updates_per_s']} updates/s | "
+        f"p50 {total['p50_ms']} ms p99 {total['p99_ms']} ms | peak RSS {result['peak_rss_kib'] // 1024} MiB"
+    )
+    print(f"{'type':>8} {'count':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, s in result["by_type"].items():
+        print(f"{kind:>8} {s['count']:>7} {s['p50_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}")
+    print(f"api calls: {result['api_calls']}")
+    print(f"throttled: {result['throttling']['throttled']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000, help="пользователей в БД")
+    parser.add_argument("--scenarios", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64, help="сценариев одновременно")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite", help="FSM-хранилище")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="пик памяти Python через tracemalloc (медленнее)")
+    parser.add_argument("--json", help="куда записать результат в JSON ('-' — stdout)")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(_run(args))
+    if args.json == "-":
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        _print(result)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный стенд: локальный сервер, говорящий на Bot API, и bot.py, который
+работает с ним вместо api.telegram.org (BOT_API_URL).
+
+Сервер реализует getUpdates (long polling), sendMessage, sendPhoto,
+sendMediaGroup, copyMessage, editMessageText, deleteMessage (плюс getMe и
+answerCallbackQuery, которые нужны aiogram), добавляет задержку ответа и с
+заданной вероятностью отвечает 429 с retry_after.
+
+Апдейты:
+- сценарии из benchmarks.telegram_fakes (по умолчанию): следующий шаг сценария
+  выдаётся, когда бот ответил на предыдущий (или истёк --step-timeout), как если
+  бы пользователь ждал ответа; сценарии идут параллельно (--parallel);
+- --replay file.jsonl: записанные апдейты (по одному JSON Update в строке),
+  выдаются подряд с темпом --rate апдейтов в секунду.
+
+Время ответа — от выдачи апдейта в getUpdates до первого вызова Bot API в тот
+же чат (для callback — также answerCallbackQuery с его id). Для альбома
+считается только первый элемент, ответ приходит после сборки альбома.
+Чат модератора не учитывается: туда приходят уведомления по чужим апдейтам.
+
+Стенд сам заполняет временную БД и запускает bot.py; с --no-spawn только
+поднимает сервер, а бот запускается вручную с BOT_API_URL=http://host:port.
+
+    python -m benchmarks.fake_api --users 2000 --scenarios 1000 --latency 20 --rate-429 0.01 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+import database
+from benchmarks.stats import percentile
+from benchmarks.telegram_fakes import BOT_TOKEN, fake_result, generate_scenarios, seed_users
+from commands import MODERATOR_CHAT_ID
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# Методы, на которые может прийти 429
+RATE_LIMITED_METHODS = frozenset({
+    "sendMessage", "sendPhoto", "sendMediaGroup", "copyMessage", "editMessageText",
+})
+# Поля, которые aiogram передаёт JSON-строкой в form-data
+JSON_FIELDS = ("media", "reply_markup", "allowed_updates")
+
+
+class Expectation:
+    """Ожидание ответа на один выданный апдейт."""
+
+    __slots__ = ("kind", "delivered_at", "replied_at", "done")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.delivered_at: Optional[float] = None
+        self.replied_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+
+def update_kind(update: Dict[str, Any]) -> str:
+    """Тип апдейта для отчёта — как в benchmarks.telegram_fakes."""
+    callback = update.get("callback_query")
+    if callback:
+        data = callback.get("data") or ""
+        for prefix, kind in (("lang_", "lang"), ("approve_", "approve"), ("reject_", "reject")):
+            if data.startswith(prefix):
+                return kind
+        return "callback"
+    message = update.get("message") or {}
+    if message.get("media_group_id"):
+        return "album"
+    if message.get("photo"):
+        return "photo"
+    text = message.get("text") or ""
+    if text.startswith("/"):
+        return text[1:].split()[0].split("@")[0] or "text"
+    return "text"
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_429: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.injected_429 = 0
+        self.ready = asyncio.Event()
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._new_updates = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1_000_000
+        self._expectations: Dict[int, Expectation] = {}
+        self._by_chat: Dict[int, Deque[Expectation]] = defaultdict(deque)
+        self._by_callback: Dict[str, Expectation] = {}
+        self.delivered: List[Expectation] = []
+
+    # --- апдейты ---
+
+    def push(self, update: Dict[str, Any], kind: Optional[str] = None, track: bool = True) -> Expectation:
+        """Ставит апдейт в очередь getUpdates. update_id перенумеровывается по порядку выдачи."""
+        update = dict(update, update_id=self._next_update_id)
+        self._next_update_id += 1
+        expectation = Expectation(kind or update_kind(update))
+        if track:
+            self._expectations[update["update_id"]] = expectation
+            callback = update.get("callback_query")
+            message = (callback or {}).get("message") or update.get("message") or {}
+            chat_id = (message.get("chat") or {}).get("id")
+            if chat_id is not None and chat_id != MODERATOR_CHAT_ID:
+                self._by_chat[chat_id].append(expectation)
+            if callback:
+                self._by_callback[callback["id"]] = expectation
+        self._pending.append(update)
+        self._new_updates.set()
+        return expectation
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        while self._pending and self._pending[0]["update_id"] < offset:
+            self._pending.popleft()
+        if not self._pending and timeout > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = list(self._pending)[:limit]
+        now = time.perf_counter()
+        for update in batch:
+            expectation = self._expectations.pop(update["update_id"], None)
+            if expectation is not None:
+                expectation.delivered_at = now
+                self.delivered.append(expectation)
+        return batch
+
+    # --- ответы бота ---
+
+    def _resolve(self, expectation: Expectation) -> None:
+        if not expectation.done.is_set() and expectation.delivered_at is not None:
+            expectation.replied_at = time.perf_counter()
+            expectation.done.set()
+
+    def _observe_reply(self, method: str, params: Dict[str, Any]) -> None:
+        if method == "answerCallbackQuery":
+            expectation = self._by_callback.pop(str(params.get("callback_query_id")), None)
+            if expectation is not None:
+                self._resolve(expectation)
+            return
+        try:
+            chat_id = int(params.get("chat_id"))
+        except (TypeError, ValueError):
+            return
+        queue = self._by_chat.get(chat_id)
+        while queue:
+            expectation = queue[0]
+            if expectation.done.is_set():
+                queue.popleft()
+                continue
+            if expectation.delivered_at is None:
+                return
+            queue.popleft()
+            self._resolve(expectation)
+            return
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        params: Dict[str, Any] = {}
+        for key, value in (await request.post()).items():
+            if not isinstance(value, str):
+                params[key] = "<file>"
+            elif key in JSON_FIELDS:
+                params[key] = json.loads(value)
+            else:
+                params[key] = value
+        return params
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] += 1
+        if method == "getUpdates":
+            self.ready.set()
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if method in RATE_LIMITED_METHODS and self.rate_429 and random.random() < self.rate_429:
+            self.injected_429 += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        self._observe_reply(method, params)
+        self._next_message_id += 10
+        return web.json_response({"ok": True, "result": fake_result(method, params, self._next_message_id)})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def report(self) -> Dict[str, Any]:
+        by_kind: Dict[str, List[float]] = defaultdict(list)
+        delivered: Counter = Counter()
+        for expectation in self.delivered:
+            delivered[expectation.kind] += 1
+            if expectation.replied_at is not None:
+                by_kind[expectation.kind].append(expectation.replied_at - expectation.delivered_at)
+        replied = [e for e in self.delivered if e.replied_at is not None]
+        first = min((e.delivered_at for e in self.delivered), default=0.0)
+        last = max((e.replied_at for e in replied), default=first)
+        elapsed = last - first
+        all_latencies = [x for v in by_kind.values() for x in v]
+        return {
+            "updates_delivered": len(self.delivered),
+            "updates_replied": len(replied),
+            "elapsed_s": round(elapsed, 3),
+            "replies_per_s": round(len(replied) / elapsed, 1) if elapsed > 0 else 0.0,
+            "reply_latency": _summary(all_latencies, len(self.delivered)),
+            "by_type": {kind: _summary(by_kind[kind], delivered[kind]) for kind in sorted(delivered)},
+            "api_calls": dict(sorted(self.calls.items())),
+            "injected_429": self.injected_429,
+        }
+
+
+def _summary(latencies: List[float], delivered: int) -> Dict[str, Any]:
+    return {
+        "delivered": delivered,
+        "replied": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1e3, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1e3, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1e3, 2),
+    }
+
+
+async def _play_scenarios(api: FakeBotAPI, args) -> None:
+    scenarios = generate_scenarios(args.scenarios, args.users, seed=args.seed)
+    slots = asyncio.Semaphore(args.parallel)
+
+    async def play(steps):
+        async with slots:
+            i = 0
+            while i < len(steps):
+                kind, update = steps[i]
+                if kind == "album":
+                    # Все элементы альбома уходят сразу, ответ ждём на первый
+                    group = [u for k, u in steps[i:] if k == "album"]
+                    expectation = api.push(group[0], kind)
+                    for item in group[1:]:
+                        api.push(item, kind, track=False)
+                    i += len(group)
+                else:
+                    expectation = api.push(update, kind)
+                    i += 1
+                try:
+                    await asyncio.wait_for(expectation.done.wait(), args.step_timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    await asyncio.gather(*(play(steps) for steps in scenarios))
+
+
+async def _play_replay(api: FakeBotAPI, args) -> None:
+    with open(args.replay, "r", encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    expectations = []
+    for update in updates:
+        expectations.append(api.push(update))
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+    pending = [e.done.wait() for e in expectations]
+    await asyncio.wait([asyncio.ensure_future(p) for p in pending], timeout=args.step_timeout)
+
+
+def _seed_db(path: str, users: int) -> None:
+    database.init_db(path)
+    database.close_db()
+    conn = sqlite3.connect(path)
+    with conn:
+        seed_users(conn, users)
+    conn.close()
+
+
+async def _run(args) -> dict:
+    api = FakeBotAPI(args.latency / 1000, args.jitter / 1000, args.rate_429, args.retry_after)
+    runner = web.AppRunner(api.app(), handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    base_url = f"http://{args.host}:{args.port}"
+
+    bot_process = None
+    log_file = None
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            if args.spawn:
+                db_path = os.path.join(tmp, "users.db")
+                _seed_db(db_path, args.users)
+                env = dict(
+                    os.environ,
+                    BOT_TOKEN=BOT_TOKEN,
+                    BOT_API_URL=base_url,
+                    DB_PATH=db_path,
+                    SIGNAL_FILE_IDS_PATH=os.path.join(tmp, "signal_file_ids.json"),
+                    SEND_GLOBAL_RATE=str(args.send_rate),
+                    I18N_RELOAD_INTERVAL="0",
+                    BOT_MODE="polling",
+                )
+                log_file = open(os.path.join(tmp, "bot.log"), "wb")
+                bot_process = await asyncio.create_subprocess_exec(
+                    sys.executable, "bot.py", cwd=str(PROJECT_ROOT), env=env, stdout=log_file, stderr=log_file,
+                )
+            else:
+                print(f"fake Bot API on {base_url}, waiting for the bot to poll...")
+            await asyncio.wait_for(api.ready.wait(), args.startup_timeout)
+
+            if args.replay:
+                await _play_replay(api, args)
+            else:
+                await _play_scenarios(api, args)
+            result = api.report()
+            result["config"] = {
+                "users": args.users,
+                "scenarios": None if args.replay else args.scenarios,
+                "replay": args.replay,
+                "parallel": args.parallel,
+                "latency_ms": args.latency,
+                "jitter_ms": args.jitter,
+                "rate_429": args.rate_429,
+                "send_rate": args.send_rate,
+                "seed": args.seed,
+            }
+            return result
+        finally:
+            if bot_process is not None:
+                if bot_process.returncode is None:
+                    bot_process.send_signal(signal.SIGINT)
+                    try:
+                        await asyncio.wait_for(bot_process.wait(), 30)
+                    except asyncio.TimeoutError:
+                        bot_process.kill()
+                        await bot_process.wait()
+                log_file.close()
+                if args.bot_log:
+                    with open(os.path.join(tmp, "bot.log"), "rb") as src, open(args.bot_log, "wb") as dst:
+                        dst.write(src.read())
+            await runner.cleanup()
+
+
+def _print(result: dict) -> None:
+    total = result["reply_latency"]
+    print(
+        f"{result['updates_delivered']} updates, {result['updates_replied']} replied in {result['elapsed_s']}s: "
+        f"{result['replies_per_s']} replies/s | p50 {total['p50_ms']} ms p99 {total['p99_ms']} ms | "
+        f"429 injected: {result['injected_429']}"
+    )
+    print(f"{'type':>8} {'sent':>6} {'replied':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, s in result["by_type"].items():
+        print(f"{kind:>8} {s['delivered']:>6} {s['replied']:>8} {s['p50_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}")
+    print(f"api calls: {result['api_calls']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=2000, help="пользователей во временной БД")
+    parser.add_argument("--scenarios", type=int, default=1000)
+    parser.add_argument("--parallel", type=int, default=100, help="сценариев одновременно")
+    parser.add_argument("--replay", help="JSONL с записанными апдейтами вместо сценариев")
+    parser.add_argument("--rate", type=float, default=0.0, help="темп --replay, апдейтов/с (0 — сразу все)")
+    parser.add_argument("--step-timeout", type=float, default=10.0, help="сколько ждать ответа на апдейт, с")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа сервера, мс")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, мс")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля запросов отправки с ответом 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--send-rate", type=float, default=1000.0,
+                        help="SEND_GLOBAL_RATE бота (30 — как в проде)")
+    parser.add_argument("--no-spawn", dest="spawn", action="store_false", help="не запускать bot.py")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--bot-log", help="сохранить вывод bot.py в файл")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="куда записать результат в JSON ('-' — stdout)")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(_run(args))
+    if args.json == "-":
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        _print(result)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
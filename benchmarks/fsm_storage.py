@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Пропускная способность set_state/get_state: MemoryStorage против SQLiteStorage
+(fsm_storage.py) на временной базе, плюс время пакетной очистки просроченных
+состояний.
+
+    python -m benchmarks.fsm_storage --users 2000 --ops 20000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import async_db
+from benchmarks.stats import percentile
+from fsm_storage import SQLiteStorage
+
+STATES = ("LanguageSelection:selecting", "VerificationProcess:waiting_files", None)
+
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def _run(storage, ops: list, concurrency: int) -> tuple:
+    set_latencies, get_latencies = [], []
+    queue = list(ops)
+
+    async def worker():
+        while queue:
+            user_id, state = queue.pop()
+            key = _key(user_id)
+            t0 = time.perf_counter()
+            await storage.set_state(key, state)
+            t1 = time.perf_counter()
+            await storage.get_state(key)
+            t2 = time.perf_counter()
+            set_latencies.append(t1 - t0)
+            get_latencies.append(t2 - t1)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, set_latencies, get_latencies
+
+
+def _report(name: str, elapsed: float, set_latencies: list, get_latencies: list) -> None:
+    print(
+        f"{name:>7}: {len(set_latencies) / elapsed:8.0f} set+get/s | "
+        f"set p50 {percentile(set_latencies, 0.5) * 1e6:7.1f} us p99 {percentile(set_latencies, 0.99) * 1e6:8.1f} us | "
+        f"get p50 {percentile(get_latencies, 0.5) * 1e6:7.1f} us p99 {percentile(get_latencies, 0.99) * 1e6:8.1f} us"
+    )
+
+
+async def _main(args) -> None:
+    ops = [(random.randint(1, args.users), random.choice(STATES)) for _ in range(args.ops)]
+
+    _report("memory", *await _run(MemoryStorage(), ops, args.concurrency))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        await async_db.init_db(os.path.join(tmp, "fsm.db"))
+        storage = SQLiteStorage()
+        _report("sqlite", *await _run(storage, ops, args.concurrency))
+
+        expired = SQLiteStorage(ttl=-1)
+        for user_id in range(args.users, args.users + args.expired):
+            await expired.set_data(_key(user_id), {"n": user_id})
+        started = time.perf_counter()
+        deleted = await storage.cleanup()
+        print(f"cleanup: {deleted} expired states in {time.perf_counter() - started:.3f}s")
+        async_db.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--expired", type=int, default=5000, help="сколько просроченных состояний очистить")
+    args = parser.parse_args(argv)
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Пропускная способность S(): прежняя реализация против скомпилированных таблиц.
+
+Прежний S() воспроизведён здесь как был: нормализация кода, проверка
+_SUPPORTED, ленивый кэш и fallback на en на каждом вызове.
+
+    python -m benchmarks.i18n_lookup --calls 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import i18n
+
+_LEGACY_CACHE = {}
+
+
+def _legacy_load(lang_code: str) -> dict:
+    lang_code = (lang_code or "").strip().lower()[:2]
+    if lang_code not in i18n._SUPPORTED:
+        lang_code = i18n._DEFAULT
+    if lang_code not in _LEGACY_CACHE:
+        path = os.path.join(i18n._LOCALE_DIR, f"{lang_code}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                _LEGACY_CACHE[lang_code] = json.load(f)
+        except Exception:
+            _LEGACY_CACHE[lang_code] = {}
+    return _LEGACY_CACHE[lang_code]
+
+
+def legacy_S(text: str, lang_code: str) -> str:
+    code = (lang_code or "").strip().lower()[:2] if lang_code else i18n._DEFAULT
+    if code not in i18n._SUPPORTED:
+        code = i18n._DEFAULT
+    data = _legacy_load(code)
+    out = data.get(text)
+    if out is not None:
+        return out
+    if code != i18n._DEFAULT:
+        data_en = _legacy_load(i18n._DEFAULT)
+        out = data_en.get(text)
+    return out if out is not None else text
+
+
+def _calls_per_sec(fn, calls: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for key, lang in calls:
+            fn(key, lang)
+    return len(calls) * repeat / (time.perf_counter() - started)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    keys = list(i18n._TABLES[i18n._DEFAULT])
+    # Типичная смесь: в основном валидные коды, немного fallback на en.
+    calls = [(key, lang) for key in keys for lang in ("en", "ru", "es", "ar")] + [("nice_looking", "ru")]
+    repeat = max(1, args.calls // len(calls))
+
+    for name, fn in (("legacy S", legacy_S), ("compiled S", i18n.S)):
+        print(f"{name:>11}: {_calls_per_sec(fn, calls, repeat) / 1e6:6.2f} M calls/s")
+
+    kwargs = {"username": "someone", "status": "verified"}
+    started = time.perf_counter()
+    for _ in range(repeat):
+        legacy_S("verification_done", "ru").format(**kwargs)
+    legacy_fmt = repeat / (time.perf_counter() - started)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        i18n.T("verification_done", "ru")(**kwargs)
+    compiled_fmt = repeat / (time.perf_counter() - started)
+    print(f"{'S().format':>11}: {legacy_fmt / 1e6:6.2f} M calls/s")
+    print(f"{'T()()':>11}: {compiled_fmt / 1e6:6.2f} M calls/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Аллокации и время на клавиатуру: InlineKeyboardBuilder на каждый апдейт
+(как было в commands.py) против реестра keyboards.py.
+
+    python -m benchmarks.keyboards --iterations 2000
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+import keyboards
+from i18n import S
+
+
+def _legacy_main_menu(lang: str):
+    builder = InlineKeyboardBuilder()
+    builder.button(text=S("btn_get_signals", lang), callback_data="get_signals")
+    builder.button(text=S("btn_language", lang), callback_data="selecting_lang")
+    builder.button(text=S("btn_support", lang), url=keyboards.SUPPORT_URL)
+    builder.adjust(1, 2)
+    return builder.as_markup()
+
+
+def _legacy_unauthorized(lang: str):
+    builder = InlineKeyboardBuilder()
+    builder.button(text=S("btn_create_account", lang), url=keyboards.REGISTER_URL)
+    builder.button(text=S("btn_verify_account", lang), callback_data="verify_account")
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+def _legacy_review(user_id: int, lang: str):
+    builder = InlineKeyboardBuilder()
+    builder.button(text=S("btn_approve", lang), callback_data=f"approve_{user_id}")
+    builder.button(text=S("btn_reject", lang), callback_data=f"reject_{user_id}")
+    return builder.as_markup()
+
+
+CASES = {
+    "main_menu": (lambda i: _legacy_main_menu("ru"), lambda i: keyboards.main_menu_keyboard("ru")),
+    "unauthorized": (lambda i: _legacy_unauthorized("es"), lambda i: keyboards.unauthorized_keyboard("es")),
+    "review": (lambda i: _legacy_review(i, "ru"), lambda i: keyboards.review_keyboard(i, "ru")),
+}
+
+
+def _measure(fn, iterations: int) -> tuple:
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    keep = [fn(i) for i in range(iterations)]
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = snapshot_after.compare_to(snapshot_before, "filename")
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+    size = sum(s.size_diff for s in stats if s.size_diff > 0)
+    del keep
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    per_call = (time.perf_counter() - started) / iterations
+    return blocks / iterations, size / iterations, per_call
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    print(f"{'keyboard':>13} {'variant':>8} {'blocks/call':>12} {'bytes/call':>11} {'us/call':>8}")
+    for name, (legacy, cached) in CASES.items():
+        for variant, fn in (("builder", legacy), ("registry", cached)):
+            blocks, size, per_call = _measure(fn, args.iterations)
+            print(f"{name:>13} {variant:>8} {blocks:>12.1f} {size:>11.0f} {per_call * 1e6:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""Общие вспомогательные функции бенчмарков."""
+from typing import List
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0..1) методом ближайшего ранга; 0.0 для пустого списка."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[idx]
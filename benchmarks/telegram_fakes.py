@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Общие заготовки для benchmarks.e2e и benchmarks.fake_api: синтетические
+апдейты Telegram (JSON-словари в формате Bot API) и фейковые ответы на методы.
+
+Сценарий — последовательность апдейтов одного пользователя, которая идёт в
+том порядке, в каком её отправил бы человек (например, /start, затем кнопка
+языка). Типы апдейтов в отчётах: start, lang, text, photo, verify, album,
+approve, reject.
+"""
+import itertools
+import random
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from commands import MODERATOR_CHAT_ID
+
+BOT_ID = 123456
+BOT_TOKEN = f"{BOT_ID}:fake"
+LANGUAGES = ("en", "ru", "es", "ar")
+ALBUM_SIZE = 3
+
+# Сценарий -> вес в смеси. Альбом и /verify идут одним сценарием.
+SCENARIO_WEIGHTS = {
+    "onboarding": 30,
+    "text": 25,
+    "photo": 15,
+    "verification": 10,
+    "approve": 10,
+    "reject": 10,
+}
+
+Update = Dict[str, Any]
+# (тип апдейта, апдейт)
+Step = Tuple[str, Update]
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def _chat(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "private"}
+
+
+class UpdateFactory:
+    """Выдаёт апдейты со сквозной нумерацией update_id / message_id."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _message(self, user_id: int, **fields) -> Update:
+        update_id = fields.pop("update_id", None) or next(self._ids)
+        message = {"message_id": update_id, "date": int(time.time()), "chat": _chat(user_id), "from": _user(user_id)}
+        message.update(fields)
+        return {"update_id": update_id, "message": message}
+
+    def text(self, user_id: int, text: str) -> Update:
+        return self._message(user_id, text=text)
+
+    def photo(self, user_id: int, media_group_id: Optional[str] = None, caption: Optional[str] = None) -> Update:
+        update_id = next(self._ids)
+        fields = {
+            "photo": [{"file_id": f"photo{update_id}", "file_unique_id": f"uniq{update_id}", "width": 1280, "height": 720}],
+        }
+        if media_group_id:
+            fields["media_group_id"] = media_group_id
+        if caption:
+            fields["caption"] = caption
+        return self._message(user_id, update_id=update_id, **fields)
+
+    def callback(self, user_id: int, chat_id: int, data: str, text: str = "") -> Update:
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": _user(user_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": _chat(chat_id),
+                    "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot"},
+                    "text": text or "message",
+                },
+            },
+        }
+
+
+def scenario(kind: str, user_id: int, review_target: int, factory: UpdateFactory) -> List[Step]:
+    """
+    Апдейты одного сценария. Пользователь user_id должен быть в БД;
+    review_target — пользователь, чью заявку модератор принимает или отклоняет.
+    """
+    if kind == "onboarding":
+        return [
+            ("start", factory.text(user_id, "/start")),
+            ("lang", factory.callback(user_id, user_id, f"lang_{random.choice(LANGUAGES)}")),
+        ]
+    if kind == "text":
+        return [("text", factory.text(user_id, "hello"))]
+    if kind == "photo":
+        return [("photo", factory.photo(user_id))]
+    if kind == "verification":
+        group_id = f"album{user_id}_{random.getrandbits(32)}"
+        steps = [("verify", factory.text(user_id, "/verify"))]
+        steps += [
+            ("album", factory.photo(user_id, media_group_id=group_id, caption="id" if i == 0 else None))
+            for i in range(ALBUM_SIZE)
+        ]
+        return steps
+    if kind in ("approve", "reject"):
+        return [(kind, factory.callback(
+            MODERATOR_CHAT_ID, MODERATOR_CHAT_ID, f"{kind}_{review_target}", text="new verification",
+        ))]
+    raise ValueError(f"Unknown scenario {kind!r}")
+
+
+def generate_scenarios(
+    count: int,
+    users: int,
+    seed: int = 0,
+    weights: Optional[Dict[str, int]] = None,
+) -> List[List[Step]]:
+    """
+    count сценариев по пользователям из БД 1..users. Активные пользователи — первая
+    половина, заявки модератор разбирает у второй, чтобы ответы не путались между чатами.
+    seed_users() ставит второй половине ожидающие заявки, и каждая из них разбирается
+    один раз, пока они не кончатся: approve/reject проходят настоящий переход из pending
+    (запись в БД, уведомление, editMessageText), а не ветку «уже решено».
+    """
+    random.seed(seed)
+    weights = weights or SCENARIO_WEIGHTS
+    kinds, kind_weights = zip(*weights.items())
+    active = _active_users(users)
+    targets = list(range(active + 1, users + 1)) or [active + 1]
+    random.shuffle(targets)
+    review_targets = itertools.cycle(targets)
+    factory = UpdateFactory()
+    result = []
+    for kind in random.choices(kinds, kind_weights, k=count):
+        target = next(review_targets) if kind in ("approve", "reject") else 0
+        result.append(scenario(kind, random.randint(1, active), target, factory))
+    return result
+
+
+def iter_steps(scenarios: List[List[Step]]) -> Iterator[Step]:
+    for steps in scenarios:
+        yield from steps
+
+
+def _active_users(users: int) -> int:
+    return max(1, users // 2)
+
+
+def seed_users(conn, users: int, verified_every: int = 0) -> None:
+    """
+    Заполняет users пользователями 1..users (username userN, языки по кругу).
+    У второй половины (цели approve/reject в generate_scenarios) — ожидающая
+    заявка у MODERATOR_CHAT_ID и verification_pending = 1.
+    """
+    active = _active_users(users)
+    conn.executemany(
+        "INSERT OR REPLACE INTO users (user_id, username, username_norm, language, verification_status, verification_pending) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (
+                i, f"user{i}", f"user{i}", LANGUAGES[i % len(LANGUAGES)],
+                1 if verified_every and i % verified_every == 0 and i <= active else 0,
+                1 if i > active else 0,
+            )
+            for i in range(1, users + 1)
+        ),
+    )
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO verification_requests (user_id, username, status, submitted_at, assigned_to, assigned_at) "
+        "VALUES (?, ?, 'pending', ?, ?, ?)",
+        ((i, f"user{i}", now, MODERATOR_CHAT_ID, now) for i in range(active + 1, users + 1)),
+    )
+
+
+# --- ответы Bot API ---
+
+def _sent_message(message_id: int, chat_id: Any, **fields) -> dict:
+    try:
+        chat_id = int(chat_id)
+    except (TypeError, ValueError):
+        chat_id = 0
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": _chat(chat_id),
+        "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot"},
+    }
+    message.update(fields)
+    return message
+
+
+def fake_result(method: str, params: Dict[str, Any], message_id: int) -> Any:
+    """Правдоподобный result для метода Bot API (как в {"ok": true, "result": ...})."""
+    chat_id = params.get("chat_id")
+    if method == "getMe":
+        return {"id": BOT_ID, "is_bot": True, "first_name": "Bot", "username": "fake_bot"}
+    if method == "sendMessage":
+        return _sent_message(message_id, chat_id, text=params.get("text") or "")
+    if method == "sendPhoto":
+        return _sent_message(message_id, chat_id, photo=[{
+            "file_id": f"sent_photo{message_id}", "file_unique_id": f"sent{message_id}", "width": 1280, "height": 720,
+        }])
+    if method == "sendMediaGroup":
+        media = params.get("media") or []
+        return [_sent_message(message_id + i, chat_id) for i in range(max(1, len(media)))]
+    if method == "copyMessage":
+        return {"message_id": message_id}
+    if method == "editMessageText":
+        return _sent_message(params.get("message_id") or message_id, chat_id, text=params.get("text") or "")
+    if method == "getUpdates":
+        return []
+    return True
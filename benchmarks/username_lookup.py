@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Время поиска user_id по username в зависимости от размера таблицы users.
+
+Старый запрос (WHERE LOWER(TRIM(username)) = LOWER(?)) делает полный проход
+по таблице, новый идёт по индексу idx_users_username_norm.
+
+    python -m benchmarks.username_lookup --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import database
+
+_LEGACY_SQL = "SELECT user_id FROM users WHERE LOWER(TRIM(username)) = LOWER(?)"
+
+
+def _fill(n_rows: int) -> None:
+    with database._get_pool().writer() as conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, username, username_norm, language) VALUES (?, ?, ?, 'en')",
+            ((i, f"User_{i}", f"user_{i}") for i in range(1, n_rows + 1)),
+        )
+
+
+def _time_per_lookup(fn, names: list[str]) -> float:
+    started = time.perf_counter()
+    for name in names:
+        fn(name)
+    return (time.perf_counter() - started) / len(names)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>10} {'legacy, ms':>12} {'indexed, ms':>12}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.init_db(os.path.join(tmp, "bench.db"))
+            try:
+                _fill(size)
+                names = [f"@user_{random.randint(1, size)}" for _ in range(args.lookups)]
+
+                def legacy(name: str):
+                    return database._fetchone(_LEGACY_SQL, (name.lstrip("@"),))
+
+                # Полный проход медленный, на больших таблицах хватит меньшего числа замеров.
+                legacy_ms = _time_per_lookup(legacy, names[: max(5, args.lookups * 10_000 // size)]) * 1000
+                indexed_ms = _time_per_lookup(database.get_user_id_by_username, names) * 1000
+            finally:
+                database.close_db()
+        print(f"{size:>10} {legacy_ms:>12.3f} {indexed_ms:>12.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Стоимость проверки повторных файлов верификации в зависимости от числа
+сохранённых file_unique_id.
+
+find_verification_media() ищет по первичному ключу verification_media
+(WITHOUT ROWID, миграция 6): одиночный файл и альбом из 10 файлов, попадания
+и промахи. Для сравнения — та же таблица без ключа (полный проход), на
+больших размерах с меньшим числом замеров. Ещё печатается скорость вставки и
+размер базы на строку.
+
+    python -m benchmarks.verification_media --sizes 100000 1000000 5000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import database
+from benchmarks.stats import percentile
+
+ALBUM_SIZE = 10
+_SCAN_SQL = "SELECT user_id FROM media_scan WHERE file_unique_id = ?"
+
+
+def _unique_id(i: int) -> str:
+    # Псевдослучайный порядок, как у настоящих file_unique_id, но восстановимый по номеру
+    return f"AQAD{(i * 2654435761) % 2 ** 40:010x}"
+
+
+def _fill(n_rows: int) -> float:
+    now = time.time()
+    rows = (
+        (_unique_id(i), i % 100_000 + 1, i, f"AgACAgIAAxkBAAI{_unique_id(i)}{'x' * 50}", "photo", now)
+        for i in range(1, n_rows + 1)
+    )
+    started = time.perf_counter()
+    with database._get_pool().writer() as conn:
+        conn.executemany(
+            "INSERT INTO verification_media (file_unique_id, user_id, request_id, file_id, media_type, submitted_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    elapsed = time.perf_counter() - started
+    with database._get_pool().writer() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return elapsed
+
+
+def _latencies(fn, batches: list) -> list:
+    result = []
+    for batch in batches:
+        started = time.perf_counter()
+        fn(batch)
+        result.append(time.perf_counter() - started)
+    return result
+
+
+def _fmt(latencies: list) -> str:
+    return f"{percentile(latencies, 0.5) * 1e6:8.1f} {percentile(latencies, 0.99) * 1e6:8.1f}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--no-scan", action="store_true", help="не сравнивать с полным проходом")
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'rows':>10} {'insert/s':>9} {'B/row':>6} | {'hit p50/p99, us':>17} | {'miss p50/p99, us':>17} | "
+        f"{'album p50/p99, us':>17} | {'scan, ms':>9}"
+    )
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            database.init_db(path)
+            try:
+                fill_s = _fill(size)
+                bytes_per_row = os.path.getsize(path) / size
+
+                hits = [[_unique_id(random.randint(1, size))] for _ in range(args.lookups)]
+                misses = [[_unique_id(size + random.randint(1, size))] for _ in range(args.lookups)]
+                # Альбом пользователя: часть файлов уже присылалась, часть новые
+                albums = [
+                    [_unique_id(random.randint(1, 2 * size)) for _ in range(ALBUM_SIZE)]
+                    for _ in range(args.lookups // ALBUM_SIZE)
+                ]
+                hit = _latencies(database.find_verification_media, hits)
+                miss = _latencies(database.find_verification_media, misses)
+                album = _latencies(database.find_verification_media, albums)
+
+                scan_ms = float("nan")
+                if not args.no_scan:
+                    with database._get_pool().writer() as conn:
+                        conn.execute("CREATE TABLE media_scan AS SELECT file_unique_id, user_id FROM verification_media")
+
+                    def scan(batch):
+                        return database._fetchone(_SCAN_SQL, (batch[0],))
+
+                    # Полный проход медленный: на больших таблицах хватит меньшего числа замеров.
+                    sample = misses[: max(3, 200 * 100_000 // size)]
+                    scan_ms = percentile(_latencies(scan, sample), 0.5) * 1e3
+            finally:
+                database.close_db()
+        print(
+            f"{size:>10} {size / fill_s:>9.0f} {bytes_per_row:>6.0f} | {_fmt(hit)} | {_fmt(miss)} | "
+            f"{_fmt(album)} | {scan_ms:>9.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Запись выбора языка: старый update_user_language против write-behind буфера.
+
+Старый вариант воспроизведён как был: connect → SELECT → UPDATE/INSERT →
+commit → close на каждый вызов. Новый — database.update_user_language(),
+который кладёт запись в буфер; время включает финальный сброс в close_db().
+Нагрузка похожа на рассылку: много пользователей, часть жмёт кнопку повторно.
+
+    python -m benchmarks.write_behind --writes 5000 --users 3000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import database
+from benchmarks.stats import percentile
+
+
+def _legacy_update_user_language(path: str, user_id: int, username: str, lang: str) -> None:
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT verification_status, verification_pending FROM users WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()
+    if result:
+        cursor.execute("UPDATE users SET username = ?, language = ? WHERE user_id = ?", (username, lang, user_id))
+    else:
+        cursor.execute(
+            "INSERT INTO users (user_id, username, language, verification_status, verification_pending) VALUES (?, ?, ?, 0, 0)",
+            (user_id, username, lang),
+        )
+    conn.commit()
+    conn.close()
+
+
+def _run(write, ops: list) -> list[float]:
+    latencies = []
+    for user_id, lang in ops:
+        t0 = time.perf_counter()
+        write(user_id, f"user{user_id}", lang)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def _report(name: str, latencies: list[float], elapsed: float, commits: int) -> None:
+    print(
+        f"{name:>12}: {len(latencies) / elapsed:9.0f} writes/s | {commits:6d} commits "
+        f"({commits / elapsed:8.0f}/s) | p50 {percentile(latencies, 0.5) * 1e6:8.1f} us "
+        f"p99 {percentile(latencies, 0.99) * 1e6:8.1f} us"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=3000)
+    args = parser.parse_args(argv)
+
+    ops = [(random.randint(1, args.users), random.choice(("en", "ru", "es", "ar"))) for _ in range(args.writes)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        database.init_db(legacy_path)
+        database.close_db()
+        started = time.perf_counter()
+        latencies = _run(lambda *a: _legacy_update_user_language(legacy_path, *a), ops)
+        _report("legacy", latencies, time.perf_counter() - started, len(ops))
+
+        database.init_db(os.path.join(tmp, "buffered.db"))
+        flushes_before = database.write_buffer.flushes
+        started = time.perf_counter()
+        latencies = _run(database.update_user_language, ops)
+        database.close_db()
+        elapsed = time.perf_counter() - started
+        _report("write-behind", latencies, elapsed, database.write_buffer.flushes - flushes_before)
+        print(f"buffer: {database.write_buffer.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,98 @@
 import asyncio
+import functools
+import logging
 import os
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-from commands import MODERATOR_CHAT_ID, dp as router1
-from database import init_db
+import async_db
+import database
+import i18n
+import metrics
+from commands import (
+    MODERATOR_CHAT_ID,
+    background_tasks,
+    dp as router1,
+    duplicate_media,
+    moderators,
+    send_reassigned_card,
+    throttling,
+    verification_albums,
+)
+from fsm_storage import SQLiteStorage
+from middlewares import UpdateDeduplicationMiddleware
+from send_scheduler import SendScheduler
 from signal_photos import ensure_signal_photos
+from webhook import run_webhook
 
 async def main():
-    init_db()
+    # DB_AUTO_MIGRATE=0 — миграции запускаются отдельно: python migrations.py
+    await async_db.init_db(migrate=os.environ.get("DB_AUTO_MIGRATE", "1") != "0")
 
-    bot = Bot(token=os.environ.get("BOT_TOKEN", "8472110529:AAFmFaryS_wWq9ZoqXTfEA9ozC5p_fMzrC8"))
-    dp = Dispatcher()
+    # BOT_API_URL — другой сервер Bot API (локальный telegram-bot-api или benchmarks.fake_api)
+    api_url = os.environ.get("BOT_API_URL")
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    bot = Bot(token=os.environ.get("BOT_TOKEN", "8472110529:AAFmFaryS_wWq9ZoqXTfEA9ozC5p_fMzrC8"), session=session)
+    scheduler = SendScheduler(
+        low_priority_chats=set(moderators),
+        global_rate=float(os.environ.get("SEND_GLOBAL_RATE", "30")),
+    )
+    bot.session.middleware(scheduler)
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+    # Повторные доставки одного апдейта (ретраи вебхука, повтор getUpdates)
+    dedup = UpdateDeduplicationMiddleware()
+    dp.update.outer_middleware(dedup)
     dp.include_routers(router1)
 
+    # METRICS_PORT — эндпоинт Prometheus /metrics (см. metrics.py)
+    metrics_runner = None
+    if metrics.ENABLED:
+        bot.session.middleware(metrics.ApiMetricsMiddleware())
+        metrics.instrument_router(router1)
+        metrics.register_gauges("bot_albums", verification_albums.stats)
+        metrics.register_gauges("bot_background_tasks", background_tasks.stats)
+        metrics.register_gauges("bot_user_cache", database.user_cache.stats)
+        metrics.register_gauges("bot_write_buffer", database.write_buffer.stats)
+        metrics.register_gauges("bot_fsm", storage.stats)
+        metrics.register_gauges("bot_send_scheduler", scheduler.stats)
+        metrics.register_gauges("bot_throttling", throttling.stats)
+        metrics.register_gauges("bot_i18n", i18n.stats)
+        metrics.register_gauges("bot_moderators", moderators.stats)
+        metrics.register_gauges("bot_update_dedup", dedup.stats)
+        metrics.register_gauges("bot_duplicate_media", lambda: dict(duplicate_media))
+        metrics_runner = await metrics.start_server()
+
     await ensure_signal_photos(bot, MODERATOR_CHAT_ID)
 
-    await dp.start_polling(bot)
+    # I18N_RELOAD_INTERVAL=0 отключает перезагрузку локалей без рестарта
+    reload_interval = float(os.environ.get("I18N_RELOAD_INTERVAL", "2"))
+    watcher = asyncio.create_task(i18n.watch_locales(reload_interval)) if reload_interval > 0 else None
+
+    cleanup = asyncio.create_task(storage.run_cleanup())
+    reassign = asyncio.create_task(moderators.run_reassign(functools.partial(send_reassigned_card, bot)))
+
+    try:
+        # BOT_MODE=webhook — aiohttp-сервер (настройки в webhook.py), по умолчанию polling
+        if os.environ.get("BOT_MODE", "polling") == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        cleanup.cancel()
+        reassign.cancel()
+        # Сначала отправляем недособранные альбомы, потом ждём всю фоновую работу,
+        # чтобы не оставить пользователя без verification_pending.
+        await verification_albums.flush_all()
+        await background_tasks.drain(float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "20")))
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        async_db.shutdown()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     print("Successfully launched!")
     asyncio.run(main())
\ No newline at end of file
@@ -1,34 +1,64 @@
 import asyncio
+import logging
 import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
 from aiogram import Router, F, types, Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from collections import defaultdict
 from aiogram.types import InputMediaPhoto, InputMediaVideo
 
-_verification_albums: dict[str, list] = defaultdict(list)
-
-from database import (
-    user_exists,
-    add_user,
-    is_verification_pending,
+from albums import AlbumAggregator, PendingAlbum
+from async_db import (
+    decide_verification,
+    decide_verifications,
+    find_verification_media,
+    list_pending_verifications,
+    record_verification_media,
+    withdraw_verification_request,
     set_verification_pending,
-    get_user_info,
     get_user_id_by_username,
     update_verification_status,
-    is_verified,
     get_user_language,
     update_user_language,
 )
-from i18n import S
-from signal_photos import get_signal_photo_file_id, load_signal_file_ids
+from database import VERIFICATION_APPROVED, VERIFICATION_PENDING, VERIFICATION_REJECTED, MediaRecord, UserProfile
+from i18n import S, T
+from keyboards import (
+    accepted_keyboard,
+    language_keyboard,
+    main_menu_keyboard,
+    pending_keyboard,
+    review_keyboard,
+    unauthorized_keyboard,
+)
+from middlewares import FreshVerificationMiddleware, ThrottlingMiddleware, UserContextMiddleware
+from moderators import ModeratorPool
+from signal_photos import SIGNAL_ASSETS, send_asset_photo
+from tasks import TaskSupervisor
 
-dp = Router()
+logger = logging.getLogger(__name__)
 
-MODERATOR_CHAT_ID = 5081716116
+# MODERATOR_CHAT_IDS / MODERATOR_ASSIGNMENT / MODERATOR_REVIEW_TIMEOUT — см. moderators.py
+moderators = ModeratorPool.from_env(default=(5081716116,))
+MODERATOR_CHAT_ID = moderators.primary
 MODERATOR_LANG = "ru"
+PENDING_PAGE_SIZE = 10
+MEDIA_GROUP_LIMIT = 10
+
+dp = Router()
+# Троттлинг раньше загрузки профиля: лишние апдейты не доходят до БД.
+throttling = ThrottlingMiddleware(exempt=set(moderators))
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+dp.message.outer_middleware(UserContextMiddleware())
+dp.callback_query.outer_middleware(UserContextMiddleware())
+# Хендлеры с flags=FRESH_VERIFICATION видят verified/pending прямо из БД (см. middlewares.py)
+dp.message.middleware(FreshVerificationMiddleware())
+dp.callback_query.middleware(FreshVerificationMiddleware())
+FRESH_VERIFICATION = {"fresh_verification": True}
 
 # FSM
 class LanguageSelection(StatesGroup):
@@ -42,15 +72,160 @@ class ModeratorReview(StatesGroup):
 
 _verification_media_scheduled: set[str] = set()
 
+# file_unique_id -> (user_id, статус заявки) для уже присланных файлов
+KnownMedia = Dict[str, Tuple[int, Optional[str]]]
+_STATUS_MARK = {VERIFICATION_PENDING: "⏳", VERIFICATION_APPROVED: "✅", VERIFICATION_REJECTED: "❌"}
+# Заявки с повторными файлами: answered — ответили пользователю без пересылки, flagged — пометка в карточке
+duplicate_media = {"answered": 0, "flagged": 0}
+
+
+def _media_record(message: types.Message) -> MediaRecord:
+    if message.photo:
+        photo = message.photo[-1]
+        return photo.file_unique_id, photo.file_id, "photo"
+    return message.video.file_unique_id, message.video.file_id, "video"
+
+
+def _is_own_resubmission(user_id: int, new: List[MediaRecord], known: KnownMedia) -> bool:
+    return bool(known) and not new and all(owner == user_id for owner, _ in known.values())
+
+
+async def _split_known_media(user_id: int, records: List[MediaRecord]) -> Tuple[List[MediaRecord], KnownMedia]:
+    """
+    Делит файлы заявки на новые и уже присланные раньше (один запрос по
+    первичному ключу verification_media). Если новых нет и все старые свои,
+    заявку дальше не отправляем — вызывающий отвечает пользователю.
+    """
+    known = await find_verification_media([record[0] for record in records])
+    new = [record for record in records if record[0] not in known]
+    if known:
+        duplicate_media["answered" if _is_own_resubmission(user_id, new, known) else "flagged"] += 1
+    return new, known
+
+
+async def send_review_card(
+    bot: Bot,
+    moderator: int,
+    user_id: int,
+    username_display: str,
+    reassigned: bool = False,
+    known: Optional[KnownMedia] = None,
+    no_media: bool = False,
+):
+    """
+    Карточка заявки с кнопками approve_/reject_ в чат модератора; known — пометка о повторных
+    файлах, no_media — у переназначенной заявки нет сохранённых файлов.
+    """
+    mod_text = (
+        f"{S('moderator_new_verification', MODERATOR_LANG)}\n\n"
+        f"{S('moderator_user_id', MODERATOR_LANG)} <code>{user_id}</code>\n"
+        f"{S('moderator_username', MODERATOR_LANG)} @{username_display}"
+    )
+    if known:
+        owners = ", ".join(sorted({
+            f"<code>{owner}</code>{_STATUS_MARK.get(status, '')}" for owner, status in known.values()
+        }))
+        mod_text += "\n\n" + T("moderator_duplicate_media", MODERATOR_LANG)(count=len(known), owners=owners)
+    if reassigned:
+        mod_text += f"\n\n{S('moderator_reassigned', MODERATOR_LANG)}"
+        if no_media:
+            mod_text += f" {S('moderator_reassigned_no_media', MODERATOR_LANG)}"
+
+    await bot.send_message(
+        chat_id=moderator,
+        text=mod_text,
+        reply_markup=review_keyboard(user_id, MODERATOR_LANG),
+        parse_mode = "HTML"
+    )
+
+
+def _input_media(record: MediaRecord):
+    _, file_id, media_type = record
+    return InputMediaVideo(media=file_id) if media_type == "video" else InputMediaPhoto(media=file_id)
+
 
-def get_language_keyboard():
-    builder = InlineKeyboardBuilder()
-    builder.button(text=S("btn_english", "en"), callback_data="lang_en")
-    builder.button(text=S("btn_russian", "ru"), callback_data="lang_ru")
-    builder.button(text=S("btn_spanish", "es"), callback_data="lang_es")
-    builder.button(text=S("btn_arabic", "ar"), callback_data="lang_ar")
-    builder.adjust(2)
-    return builder.as_markup()
+async def _send_media(bot: Bot, chat_id: int, media_list: list):
+    """Файлы одним сообщением или альбомами по 10 (лимит sendMediaGroup)."""
+    for i in range(0, len(media_list), MEDIA_GROUP_LIMIT):
+        chunk = media_list[i:i + MEDIA_GROUP_LIMIT]
+        if len(chunk) == 1:
+            # sendMediaGroup требует от 2 элементов
+            item = chunk[0]
+            send = bot.send_video if isinstance(item, InputMediaVideo) else bot.send_photo
+            await send(chat_id, item.media, caption=item.caption)
+        else:
+            await bot.send_media_group(chat_id=chat_id, media=chunk)
+
+
+async def send_reassigned_card(
+    bot: Bot,
+    moderator: int,
+    user_id: int,
+    username: Optional[str],
+    media: List[MediaRecord],
+):
+    """Уведомление для ModeratorPool.run_reassign(): файлы заявки заново по file_id и карточка."""
+    if media:
+        await _send_media(bot, moderator, [_input_media(record) for record in media])
+    await send_review_card(
+        bot, moderator, user_id, username or S("na", MODERATOR_LANG), reassigned=True, no_media=not media,
+    )
+
+
+async def _delivery_failed(bot: Bot, user_id: int, request_id: int, moderator: int, created: bool, lang: str):
+    """
+    Файлы или карточка не дошли до модератора (вызывается из except). Новую заявку
+    снимаем вместе с verification_pending, иначе она висела бы без карточки;
+    состояние waiting_files остаётся — пользователь присылает файлы ещё раз.
+    """
+    logger.exception("Failed to deliver verification of %s to moderator %s", user_id, moderator)
+    if created:
+        await withdraw_verification_request(request_id, user_id)
+    await bot.send_message(chat_id=user_id, text=S("verification_send_failed", lang))
+
+
+async def _send_verification_album(album: PendingAlbum):
+    """Отправляет собранный альбом модератору (вызывается AlbumAggregator)."""
+    meta = album.meta
+    bot: Bot = meta["bot"]
+    user_id_db = meta["user_id_db"]
+
+    # Элементы альбома — (InputMedia, MediaRecord)
+    new, known = await _split_known_media(album.user_id, [record for _, record in album.items])
+    if _is_own_resubmission(album.user_id, new, known):
+        # Состояние waiting_files остаётся — пользователь может прислать новые файлы
+        await bot.send_message(chat_id=album.user_id, text=S("duplicate_media", meta["lang"]))
+        return
+
+    request_id, moderator, created = await moderators.assign(album.user_id, meta["username"])
+
+    try:
+        # 1️⃣ Отправляем альбом — только файлы, которых модераторы ещё не видели
+        media_list = [item for item, record in album.items if record[0] not in known]
+        if media_list:
+            # Объекты aiogram неизменяемые — подпись ставим на копию первого элемента
+            media_list[0] = media_list[0].model_copy(update={"caption": album.caption or ''})
+            await _send_media(bot, moderator, media_list)
+            # Только после пересылки: не дошедший до модератора файл можно прислать снова
+            await record_verification_media(request_id, album.user_id, new)
+
+        # 2️⃣ Отправляем кнопки отдельным сообщением
+        await send_review_card(bot, moderator, user_id_db, meta["username_display"], known=known)
+    except Exception:
+        await _delivery_failed(bot, album.user_id, request_id, moderator, created, meta["lang"])
+        return
+
+    await bot.send_message(
+        chat_id=album.user_id,
+        text=S("files_received", meta["lang"]),
+    )
+
+    await meta["state"].clear()
+
+
+# Фоновая работа хендлеров (отправка альбомов модератору); bot.py дожидается её при остановке.
+background_tasks = TaskSupervisor("background")
+verification_albums = AlbumAggregator(_send_verification_album, supervisor=background_tasks)
 
 
 @dp.message(Command("start", "lang"))
@@ -59,50 +234,48 @@ async def start(message: types.Message, state: FSMContext):
     await message.answer(
         text=S("select_language_message", "en"),
         parse_mode="HTML",
-        reply_markup=get_language_keyboard(),
+        reply_markup=language_keyboard(),
     )
 
 
 @dp.callback_query(LanguageSelection.selecting, F.data.startswith("lang_"))
-async def select_language(callback: types.CallbackQuery, state: FSMContext):
+async def select_language(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
     user_id = callback.from_user.id
     username = callback.from_user.username
     lang_code = callback.data.replace("lang_", "").strip().lower()
     if lang_code not in ("en", "ru", "es", "ar"):
         lang_code = "en"
 
-    update_user_language(user_id, username, lang_code)
+    await update_user_language(user_id, username, lang_code)
     await callback.message.delete()
 
-    builder = InlineKeyboardBuilder()
-    builder.button(text=S("btn_get_signals", lang_code), callback_data="get_signals")
-    builder.button(text=S("btn_language", lang_code), callback_data="selecting_lang")
-    builder.button(text=S("btn_support", lang_code), url="https://t.me/ScannerManager")
-    builder.adjust(1, 2)
-
-    ids = load_signal_file_ids()
-    await callback.message.answer_photo(
-        photo = ids.get("welcome"),
-        reply_markup=builder.as_markup(),
+    sent = await send_asset_photo(
+        bot,
+        callback.message.chat.id,
+        "welcome",
+        reply_markup=main_menu_keyboard(lang_code),
     )
+    if sent is None:
+        # Картинку отправить не удалось — меню всё равно должно дойти
+        await callback.message.answer(
+            text=S("welcome", lang_code),
+            reply_markup=main_menu_keyboard(lang_code),
+        )
 
 
 @dp.callback_query(F.data == "selecting_lang")
-async def lang_selecting(callback: types.CallbackQuery, state: FSMContext):
+async def lang_selecting(callback: types.CallbackQuery, state: FSMContext, lang: str):
     await state.set_state(LanguageSelection.selecting)
-    lang = get_user_language(callback.from_user.id)
     await callback.message.answer(
         text=S("select_language_message", lang),
         parse_mode="HTML",
-        reply_markup=get_language_keyboard(),
+        reply_markup=language_keyboard(),
     )
 
 
-@dp.callback_query(F.data == "get_signals")
-async def get_signals(callback: types.CallbackQuery, state: FSMContext):
-    user_id = callback.from_user.id
-    lang = get_user_language(user_id)
-    if is_verified(user_id):
+@dp.callback_query(F.data == "get_signals", flags=FRESH_VERIFICATION)
+async def get_signals(callback: types.CallbackQuery, state: FSMContext, lang: str, verified: bool):
+    if verified:
         await callback.message.answer(
             text=S("get_signals_instruction", lang),
             parse_mode="HTML",
@@ -110,16 +283,16 @@ async def get_signals(callback: types.CallbackQuery, state: FSMContext):
     else:
         await throw_unauthorized(callback.message, lang)
 
-@dp.callback_query(F.data == "verify_account")
-async def verify_callback(callback: types.CallbackQuery, state: FSMContext):
+@dp.callback_query(F.data == "verify_account", flags=FRESH_VERIFICATION)
+async def verify_callback(
+    callback: types.CallbackQuery, state: FSMContext, lang: str, verified: bool, pending: bool
+):
     message = callback.message
-    user_id = message.chat.id
-    lang = get_user_language(user_id)
 
-    if is_verified(user_id):
+    if verified:
         await message.reply(S("already_verified", lang))
         return
-    if is_verification_pending(user_id):
+    if pending:
         await message.reply(S("verification_pending", lang))
         return
 
@@ -127,15 +300,12 @@ async def verify_callback(callback: types.CallbackQuery, state: FSMContext):
     await message.reply(S("verify_request", lang), parse_mode="HTML")
 
 
-@dp.message(Command("verify"))
-async def verify(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-    lang = get_user_language(user_id)
-
-    if is_verified(user_id):
+@dp.message(Command("verify"), flags=FRESH_VERIFICATION)
+async def verify(message: types.Message, state: FSMContext, lang: str, verified: bool, pending: bool):
+    if verified:
         await message.reply(S("already_verified", lang))
         return
-    if is_verification_pending(user_id):
+    if pending:
         await message.reply(S("verification_pending", lang))
         return
 
@@ -146,13 +316,13 @@ async def verify(message: types.Message, state: FSMContext):
 async def receive_verification_files(
     message: types.Message,
     state: FSMContext,
-    bot: Bot
+    bot: Bot,
+    profile: Optional[UserProfile],
+    lang: str,
 ):
     user_id = message.from_user.id
-    lang = get_user_language(user_id)
-    user_info = get_user_info(user_id)
 
-    if not user_info:
+    if not profile:
         await message.reply(S("user_not_found", lang))
         return
     
@@ -160,7 +330,7 @@ async def receive_verification_files(
         await message.reply(S("need_file", lang))
         return
 
-    user_id_db, username = user_info
+    user_id_db, username = profile.user_id, profile.username
     username_display = username if username else S("na", MODERATOR_LANG)
 
     # -------------------------------------------------
@@ -168,155 +338,219 @@ async def receive_verification_files(
     # -------------------------------------------------
     if message.media_group_id:
 
-        group_id = message.media_group_id
-
-        if group_id not in _verification_albums:
-            _verification_albums[group_id] = {
-                "user_id": user_id,
+        if message.photo:
+            item = InputMediaPhoto(media=message.photo[-1].file_id)
+        else:
+            item = InputMediaVideo(media=message.video.file_id)
+
+        verification_albums.add(
+            message.media_group_id,
+            user_id,
+            (item, _media_record(message)),
+            caption=message.caption,
+            meta={
+                "bot": bot,
+                "state": state,
+                "lang": lang,
                 "user_id_db": user_id_db,
+                "username": username,
                 "username_display": username_display,
-                "media": [],
-                "caption": message.caption or "",
-            }
+            },
+        )
 
-        album = _verification_albums[group_id]
+    else:
 
-        # Добавляем файл
-        if message.photo:
-            album["media"].append(
-                InputMediaPhoto(media=message.photo[-1].file_id)
-            )
-        elif message.video:
-            album["media"].append(
-                InputMediaVideo(media=message.video.file_id)
-            )
+        new, known = await _split_known_media(user_id, [_media_record(message)])
+        if _is_own_resubmission(user_id, new, known):
+            await message.reply(S("duplicate_media", lang))
+            return
 
-        # Если есть caption — сохраняем
-        if message.caption:
-            album["caption"] = message.caption
+        request_id, moderator, created = await moderators.assign(user_id, username)
 
-        # Планируем отправку только один раз
-        if len(album["media"]) == 1:
+        try:
+            # Чужой файл не пересылаем повторно — модератор увидит пометку в карточке
+            if new:
+                await message.copy_to(
+                    chat_id=moderator,
+                    caption=message.caption or '',
+                    parse_mode="HTML",
+                )
+                await record_verification_media(request_id, user_id, new)
 
-            async def send_album():
-                await asyncio.sleep(1)  # ждём пока Telegram пришлёт все элементы
+            await send_review_card(bot, moderator, user_id_db, username_display, known=known)
+        except Exception:
+            await _delivery_failed(bot, user_id, request_id, moderator, created, lang)
+            return
 
-                album_data = _verification_albums.pop(group_id, None)
-                if not album_data:
-                    return
+        await message.reply(S("files_received", lang))
+        await state.clear()
 
-                media_list = album_data["media"]
 
-                media_list[0].caption = album_data['caption'] or ''
 
-                # 1️⃣ Отправляем альбом
-                await bot.send_media_group(
-                    chat_id=MODERATOR_CHAT_ID,
-                    media=media_list,
-                )
+async def _notify_decision(bot: Bot, user_id: int, approved: bool):
+    lang = await get_user_language(user_id)
+    if approved:
+        await bot.send_message(chat_id=user_id, text=S("accepted", lang), reply_markup=accepted_keyboard(lang))
+    else:
+        await bot.send_message(chat_id=user_id, text=S("rejected", lang))
 
-                # 2️⃣ Отправляем кнопки отдельным сообщением
 
-                mod_text = (
-                    f"{S('moderator_new_verification', MODERATOR_LANG)}\n\n"
-                    f"{S('moderator_user_id', MODERATOR_LANG)} <code>{user_id_db}</code>\n" 
-                    f"{S('moderator_username', MODERATOR_LANG)} @{username_display}"
-                )
-                builder = InlineKeyboardBuilder()
-                builder.button(text=S("btn_approve", MODERATOR_LANG), callback_data=f"approve_{album_data['user_id_db']}")
-                builder.button(text=S("btn_reject", MODERATOR_LANG), callback_data=f"reject_{album_data['user_id_db']}")
-
-                await bot.send_message(
-                    chat_id=MODERATOR_CHAT_ID,
-                    text=mod_text,
-                    reply_markup=builder.as_markup(),
-                    parse_mode = "HTML"
-                )
+async def _notify_decision_safe(bot: Bot, user_id: int, approved: bool):
+    # Пользователь мог заблокировать бота — это не должно ронять рассылку остальным
+    try:
+        await _notify_decision(bot, user_id, approved)
+    except Exception as e:
+        logger.warning("Failed to notify %s about verification: %s", user_id, e)
 
-                set_verification_pending(user_id, True)
 
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=S("files_received", lang),
-                )
+async def _fan_out_decisions(bot: Bot, user_ids: Iterable[int], approved: bool):
+    """
+    Уведомления через фоновые задачи: submit() притормаживает, если очередь полна,
+    а темп отправки держит SendScheduler сессии бота.
+    """
+    for user_id in user_ids:
+        await background_tasks.submit(_notify_decision_safe(bot, user_id, approved), name=f"notify_{user_id}")
 
-                await state.clear()
 
-            asyncio.create_task(send_album())
+_DECISION_TEXT = {VERIFICATION_APPROVED: "moderator_approved", VERIFICATION_REJECTED: "moderator_rejected"}
 
-    else:
 
-        await message.copy_to(
-            chat_id=MODERATOR_CHAT_ID,
-            caption=message.caption or '',
-            parse_mode="HTML",
-        )
-
-        mod_text = (
-            f"{S('moderator_new_verification', MODERATOR_LANG)}\n\n"
-            f"{S('moderator_user_id', MODERATOR_LANG)} <code>{user_id_db}</code>\n" 
-            f"{S('moderator_username', MODERATOR_LANG)} @{username_display}"
-        )
-        builder = InlineKeyboardBuilder()
-        builder.button(text=S("btn_approve", MODERATOR_LANG), callback_data=f"approve_{user_id_db}")
-        builder.button(text=S("btn_reject", MODERATOR_LANG), callback_data=f"reject_{user_id_db}",)
-
-        await bot.send_message(
-            chat_id=MODERATOR_CHAT_ID,
-            text=mod_text,
-            reply_markup=builder.as_markup(),
-            parse_mode = "HTML"
-        )
+async def _review_callback(callback: types.CallbackQuery, bot: Bot, approved: bool):
+    user_id = int(callback.data.split("_", 1)[1])
 
-        set_verification_pending(user_id, True)
+    # Условный переход из pending: при двойном нажатии или одновременных approve/reject
+    # побеждает ровно один вызов. Проигравший только отвечает на callback —
+    # без записи в БД, уведомления и edit_text.
+    won, status = await decide_verification(user_id, approved, callback.from_user.id)
+    if not won:
+        answer = S("verification_not_pending", MODERATOR_LANG)
+        if status in _DECISION_TEXT:
+            answer += " " + S(_DECISION_TEXT[status], MODERATOR_LANG)
+        await callback.answer(answer)
+        return
 
-        await message.reply(S("files_received", lang))
-        await state.clear()
+    background_tasks.spawn(_notify_decision_safe(bot, user_id, approved), name=f"notify_{user_id}")
 
+    msg = S(_DECISION_TEXT[status], MODERATOR_LANG)
+    await callback.answer(msg)
+    new_text = (callback.message.text or "") + "\n\n" + msg
+    try:
+        await callback.message.edit_text(text=new_text, reply_markup=None, parse_mode="HTML")
+    except TelegramBadRequest as e:
+        # Решение уже сохранено; карточку могли удалить или изменить
+        logger.warning("Failed to update review card of %s: %s", user_id, e)
 
 
 @dp.callback_query(F.data.startswith("approve_"))
 async def approve_verification(callback: types.CallbackQuery, bot: Bot):
-    user_id = int(callback.data.replace("approve_", ""))
-    lang = get_user_language(user_id)
+    await _review_callback(callback, bot, True)
 
-    update_verification_status(user_id, True)
-    set_verification_pending(user_id, False)
 
-    builder = InlineKeyboardBuilder()
-    builder.button(text = S("btn_get_signals", lang), callback_data = "get_signals")
-    await bot.send_message(
-        chat_id=user_id, 
-        text=S("accepted", lang),
-        reply_markup = builder.as_markup()
-    ),
-    
+@dp.callback_query(F.data.startswith("reject_"))
+async def reject_verification(callback: types.CallbackQuery, bot: Bot):
+    await _review_callback(callback, bot, False)
 
-    msg = S("moderator_approved", MODERATOR_LANG)
-    await callback.answer(msg)
-    new_text = (callback.message.text or "") + "\n\n" + msg
-    await callback.message.edit_text(text=new_text, reply_markup=None, parse_mode="HTML")
 
+def _format_age(seconds: float) -> str:
+    seconds = int(max(seconds, 0))
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    return f"{seconds // 86400}d {seconds % 86400 // 3600}h"
 
-@dp.callback_query(F.data.startswith("reject_"))
-async def reject_verification(callback: types.CallbackQuery, bot: Bot):
-    user_id = int(callback.data.replace("reject_", ""))
-    lang = get_user_language(user_id)
 
-    update_verification_status(user_id, False)
-    set_verification_pending(user_id, False)
+async def _pending_page(moderator: int, page: int):
+    """Текст и клавиатура страницы /pending (очередь moderator); page приводится к допустимому диапазону."""
+    page = max(page, 1)
+    total, rows = await list_pending_verifications(
+        PENDING_PAGE_SIZE, (page - 1) * PENDING_PAGE_SIZE, assigned_to=moderator,
+    )
+    if not total:
+        return S("pending_empty", MODERATOR_LANG), None
+    pages = (total + PENDING_PAGE_SIZE - 1) // PENDING_PAGE_SIZE
+    if page > pages:
+        # Страница за концом очереди (её успели разобрать) — второй запрос только в этом случае
+        page = pages
+        total, rows = await list_pending_verifications(
+            PENDING_PAGE_SIZE, (page - 1) * PENDING_PAGE_SIZE, assigned_to=moderator,
+        )
+    now = time.time()
+    lines = [T("pending_header", MODERATOR_LANG)(total=total, page=page, pages=pages)]
+    lines += [
+        T("pending_item", MODERATOR_LANG)(
+            user_id=user_id,
+            username=username or S("na", MODERATOR_LANG),
+            waiting=_format_age(now - submitted_at),
+        )
+        for user_id, username, submitted_at in rows
+    ]
+    return "\n".join(lines), pending_keyboard(page, pages)
 
-    await bot.send_message(chat_id=user_id, text=S("rejected", lang))
 
-    msg = S("moderator_rejected", MODERATOR_LANG)
-    await callback.answer(msg)
-    new_text = (callback.message.text or "") + "\n\n" + msg
-    await callback.message.edit_text(text=new_text, reply_markup=None, parse_mode="HTML")
+@dp.message(Command("pending"))
+async def pending_cmd(message: types.Message):
+    if message.chat.id not in moderators:
+        return
+    parts = (message.text or "").split()
+    page = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+    text, keyboard = await _pending_page(message.chat.id, page)
+    await message.reply(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@dp.callback_query(F.data.startswith("pending_page_"))
+async def pending_page(callback: types.CallbackQuery):
+    if callback.message.chat.id not in moderators:
+        await callback.answer()
+        return
+    text, keyboard = await _pending_page(callback.message.chat.id, int(callback.data.rsplit("_", 1)[1]))
+    await callback.answer()
+    await callback.message.edit_text(text=text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@dp.message(Command("approve", "reject"))
+async def bulk_review_cmd(message: types.Message, bot: Bot):
+    if message.chat.id not in moderators:
+        return
+    command, *args = (message.text or "").split()
+    user_ids = [int(a) for a in args if a.isdigit()]
+    if not user_ids or len(user_ids) != len(args):
+        await message.reply(S("bulk_usage", MODERATOR_LANG), parse_mode="HTML")
+        return
+    approved = command.lstrip("/").split("@", 1)[0] == "approve"
+
+    # Все заявки одной транзакцией; уведомления уходят уже после ответа модератору
+    decided = await decide_verifications(user_ids, approved, message.from_user.id)
+    await message.reply(
+        T("bulk_approved" if approved else "bulk_rejected", MODERATOR_LANG)(
+            decided=len(decided), requested=len(set(user_ids)),
+        ),
+        parse_mode="HTML",
+    )
+    await _fan_out_decisions(bot, decided, approved)
+
+
+@dp.message(Command("moderators"))
+async def moderators_cmd(message: types.Message):
+    if message.chat.id not in moderators:
+        return
+    stats = await moderators.stats()
+    lines = [S("moderators_header", MODERATOR_LANG)]
+    lines += [
+        T("moderators_item", MODERATOR_LANG)(
+            chat_id=chat_id,
+            open=stats["open"][chat_id],
+            decided=stats["decided"][chat_id],
+            decision=_format_age(stats["decision_seconds"][chat_id]),
+        )
+        for chat_id in stats["open"]
+    ]
+    await message.reply("\n".join(lines), parse_mode="HTML")
 
 
 @dp.message(Command("verification"))
 async def verification_cmd(message: types.Message):
-    if message.chat.id != MODERATOR_CHAT_ID:
+    if message.chat.id not in moderators:
         return
     parts = (message.text or "").strip().split()
     if len(parts) != 3:
@@ -332,20 +566,22 @@ async def verification_cmd(message: types.Message):
             parse_mode="HTML",
         )
         return
-    user_id = get_user_id_by_username(username_part)
+    user_id = await get_user_id_by_username(username_part)
     if user_id is None:
         await message.reply(
-            S("verification_user_not_found", MODERATOR_LANG).format(
+            T("verification_user_not_found", MODERATOR_LANG)(
                 username=username_part.lstrip("@") or username_part
             ),
             parse_mode="HTML",
         )
         return
     status = status_str == "1"
-    update_verification_status(user_id, status)
-    set_verification_pending(user_id, False)
+    # Ожидающая заявка закрывается вместе с флагами; без заявки — прямое обновление статуса
+    if not await decide_verifications([user_id], status, message.from_user.id):
+        await update_verification_status(user_id, status)
+        await set_verification_pending(user_id, False)
     await message.reply(
-        S("verification_done", MODERATOR_LANG).format(
+        T("verification_done", MODERATOR_LANG)(
             username=username_part.lstrip("@") or username_part,
             status=S("verification_status_yes", MODERATOR_LANG) if status else S("verification_status_no", MODERATOR_LANG),
         ),
@@ -357,27 +593,17 @@ signals = [("HIGHER", "S15"), ("HIGHER", "S5"), ("LOWER", "S15"), ("LOWER", "S5"
 
 
 async def throw_unauthorized(message: types.Message, lang_code: str):
-    builder = InlineKeyboardBuilder()
-    builder.button(
-        text=S("btn_create_account", lang_code),
-        url="https://u3.shortink.io/register?utm_campaign=839002&utm_source=affiliate&utm_medium=sr&a=NUYNmfmAkKYMaY&ac=scanner-trade-bot&code=ROS149",
-    )
-    builder.button(text=S("btn_verify_account", lang_code), callback_data="verify_account")
-    builder.adjust(1)
-
     await message.answer(
         text=S("unauthorized_message", lang_code),
-        reply_markup=builder.as_markup(),
+        reply_markup=unauthorized_keyboard(lang_code),
         parse_mode="HTML",
         disable_web_page_preview=True,
     )
 
 
-@dp.message(Command("signals"))
-async def signals_cmd(message: types.Message):
-    user_id = message.from_user.id
-    lang = get_user_language(user_id)
-    if is_verified(user_id):
+@dp.message(Command("signals"), flags=FRESH_VERIFICATION)
+async def signals_cmd(message: types.Message, lang: str, verified: bool):
+    if verified:
         await message.answer(
             text=S("get_signals_instruction", lang),
             parse_mode="HTML",
@@ -386,12 +612,9 @@ async def signals_cmd(message: types.Message):
         await throw_unauthorized(message, lang)
 
 
-@dp.message(F.photo)
-async def handle_photo(message: types.Message):
-    user_id = message.from_user.id
-    lang = get_user_language(user_id)
-
-    if not is_verified(user_id):
+@dp.message(F.photo, flags=FRESH_VERIFICATION)
+async def handle_photo(message: types.Message, bot: Bot, lang: str, verified: bool):
+    if not verified:
         await throw_unauthorized(message, lang)
         return
 
@@ -410,15 +633,13 @@ async def handle_photo(message: types.Message):
     )
 
     await waiting_msg.delete()
-    photo_file_id = get_signal_photo_file_id(direction)
-    if photo_file_id:
-        await message.answer_photo(photo=photo_file_id, caption=caption, parse_mode="HTML")
-    else:
+    sent = await send_asset_photo(
+        bot, message.chat.id, SIGNAL_ASSETS[direction], caption=caption, parse_mode="HTML"
+    )
+    if sent is None:
         await message.answer(text=caption, parse_mode="HTML")
 
 
 @dp.message(F.text)
-async def unknown_command(message: types.Message):
-    user_id = message.from_user.id
-    lang = get_user_language(user_id)
+async def unknown_command(message: types.Message, lang: str):
     await message.reply(S("command_not_found", lang))
\ No newline at end of file
@@ -1,149 +1,747 @@
+import os
+import queue
 import sqlite3
-from typing import Optional, Tuple
-
-DB_NAME = "users.db"
-
-def get_connection():
-    return sqlite3.connect(DB_NAME)
-
-def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE NOT NULL,
-            username TEXT,
-            language TEXT DEFAULT 'en',
-            verification_status INTEGER DEFAULT 0,
-            verification_pending INTEGER DEFAULT 0
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+import migrations
+from user_cache import TTLCache
+from write_buffer import PendingWrite, WriteBehindBuffer
+
+DB_NAME = os.environ.get("DB_PATH", "users.db")
+
+# Пул: несколько соединений на чтение и одно сериализованное на запись.
+READ_CONNECTIONS = 4
+STATEMENT_CACHE_SIZE = 256
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 16 * 1024
+BUSY_TIMEOUT_MS = 5000
+
+USER_CACHE_SIZE = 50_000
+# Кэш и его инвалидация у каждого процесса свои. Проверки верификации и доступа к сигналам
+# перечитывают профиль из БД (middlewares.FreshVerificationMiddleware), остальное терпит TTL.
+USER_CACHE_TTL = 300.0
+
+# FSM: состояние без активности живёт сутки, просроченные строки удаляются пачками.
+FSM_STATE_TTL = 24 * 60 * 60.0
+FSM_CLEANUP_BATCH_SIZE = 1000
+
+SUPPORTED_LANGUAGES = ("en", "ru", "es", "ar")
+DEFAULT_LANGUAGE = "en"
+_LEGACY_LANGUAGE_NAMES = {"english": "en", "russian": "ru", "spanish": "es", "hindi": "en", "arabic": "ar"}
+
+
+def get_connection(path: Optional[str] = None) -> sqlite3.Connection:
+    """Отдельное соединение с теми же pragma, что и у пула (для скриптов и разовых задач)."""
+    conn = sqlite3.connect(
+        path or DB_NAME,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Долгоживущие соединения вместо connect/close на каждый запрос.
+    Читатели берутся из очереди, писатель один и защищён блокировкой:
+    в режиме WAL чтение не ждёт запись, а SQLite всё равно пропускает
+    только одного писателя.
+    """
+
+    def __init__(self, path: str, readers: int = READ_CONNECTIONS):
+        self.path = path
+        self._writer = get_connection(path)
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        self._writer_lock = threading.Lock()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all = [self._writer]
+        for _ in range(readers):
+            conn = get_connection(path)
+            self._readers.put(conn)
+            self._all.append(conn)
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Соединение на запись; коммит при выходе, откат при исключении."""
+        with self._writer_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    def close(self) -> None:
+        with self._writer_lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+# После close_db() база не открывается заново сама: поздняя задача при остановке получает ошибку
+_closed = False
+
+
+def _get_pool() -> ConnectionPool:
+    pool = _pool
+    if pool is None:
+        if _closed:
+            raise RuntimeError("Database is closed")
+        init_db()
+        pool = _pool
+    return pool
+
+
+def _fetchone(sql: str, params: tuple) -> Optional[tuple]:
+    with _get_pool().reader() as conn:
+        cursor = conn.execute(sql, params)
+        try:
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
+
+def _execute(sql: str, params: tuple) -> None:
+    with _get_pool().writer() as conn:
+        conn.execute(sql, params)
+
+
+class UserProfile:
+    """Строка users, загруженная одним запросом. Экземпляры не изменяются после создания."""
+
+    __slots__ = ("user_id", "username", "language", "verified", "pending")
+
+    def __init__(self, user_id: int, username: Optional[str], language: str, verified: bool, pending: bool):
+        self.user_id = user_id
+        self.username = username
+        self.language = language
+        self.verified = verified
+        self.pending = pending
+
+    def __repr__(self) -> str:
+        return (
+            f"UserProfile(user_id={self.user_id!r}, username={self.username!r}, language={self.language!r}, "
+            f"verified={self.verified!r}, pending={self.pending!r})"
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
+
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def _normalize_language(raw: Optional[str]) -> str:
+    raw = (raw or DEFAULT_LANGUAGE).strip().lower()
+    if raw in SUPPORTED_LANGUAGES:
+        return raw
+    return _LEGACY_LANGUAGE_NAMES.get(raw, DEFAULT_LANGUAGE)
+
+
+def _normalize_username(username: Optional[str]) -> Optional[str]:
+    """Ключ поиска по username: без @, пробелов и регистра (usernames Telegram — ASCII)."""
+    norm = (username or "").strip().lstrip("@").lower()
+    return norm or None
+
+
+def _invalidate(user_id: int) -> None:
+    user_cache.invalidate(user_id)
+
+
+_UPSERT_SQL = (
+    "INSERT INTO users (user_id, username, username_norm, language, verification_status, verification_pending) "
+    "VALUES (?, ?, ?, ?, 0, 0) ON CONFLICT(user_id) DO UPDATE SET "
+    "username = excluded.username, username_norm = excluded.username_norm, language = excluded.language"
+)
+
+
+def _flush_writes(batch: Dict[int, PendingWrite]) -> None:
+    """Сбрасывает пачку из write-behind буфера одной транзакцией."""
+    with _get_pool().writer() as conn:
+        upserts = [(user_id, *write.upsert) for user_id, write in batch.items() if write.upsert is not None]
+        if upserts:
+            conn.executemany(_UPSERT_SQL, upserts)
+        for user_id, write in batch.items():
+            if write.fields:
+                columns = sorted(write.fields)
+                conn.execute(
+                    f"UPDATE users SET {', '.join(f'{c} = ?' for c in columns)} WHERE user_id = ?",
+                    (*(write.fields[c] for c in columns), user_id),
+                )
+
+
+# Через lambda, чтобы сброс шёл через _flush_writes, обёрнутую метриками в конце модуля
+write_buffer = WriteBehindBuffer(lambda batch: _flush_writes(batch))
+
+
+def _apply_overlay(user_id: int, profile: Optional[UserProfile], write: PendingWrite) -> Optional[UserProfile]:
+    """Накладывает несброшенные изменения на профиль, прочитанный из БД."""
+    if profile is None and write.upsert is None:
+        return None
+    if profile is None:
+        profile = UserProfile(user_id, None, DEFAULT_LANGUAGE, False, False)
+    username, language = profile.username, profile.language
+    verified, pending = profile.verified, profile.pending
+    if write.upsert is not None:
+        username, _, language = write.upsert
+    fields = write.fields
+    if "language" in fields:
+        language = fields["language"]
+    if "verification_status" in fields:
+        verified = fields["verification_status"] == 1
+    if "verification_pending" in fields:
+        pending = fields["verification_pending"] == 1
+    return UserProfile(user_id, username, _normalize_language(language), verified, pending)
+
+
+def init_db(path: Optional[str] = None, migrate: bool = True):
+    """Открывает пул соединений (один раз за процесс) и применяет миграции схемы (migrations.py)."""
+    global _pool, _closed
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(path or DB_NAME)
+        _closed = False
+        pool = _pool
+
+    if migrate:
+        with pool.writer() as conn:
+            migrations.migrate(conn)
+
+
+def close_db():
+    """Закрывает все соединения пула. Вызывается при остановке бота; снова открыть — только init_db()."""
+    global _pool, _closed
+    if _pool is not None:
+        write_buffer.close()
+    with _pool_lock:
+        pool, _pool = _pool, None
+        _closed = True
+    if pool is not None:
+        with pool.writer() as conn:
+            conn.execute("PRAGMA optimize")
+        pool.close()
+    user_cache.clear()
+
+
+def load_user_profile(user_id: int) -> Optional[UserProfile]:
+    """Читает профиль из БД (минуя кэш) с учётом несброшенных записей и кладёт результат в кэш, в том числе None."""
+    epoch = user_cache.epoch
+    # Снимок буфера до SELECT: если сброс завершится между ними, строка и снимок совпадут.
+    overlay = write_buffer.overlay(user_id)
+    row = _fetchone(
+        "SELECT user_id, username, language, verification_status, verification_pending FROM users WHERE user_id = ?",
+        (user_id,),
+    )
+    profile = None
+    if row:
+        profile = UserProfile(row[0], row[1], _normalize_language(row[2]), row[3] == 1, row[4] == 1)
+    if overlay is not None:
+        profile = _apply_overlay(user_id, profile, overlay)
+    user_cache.put(user_id, profile, epoch)
+    return profile
+
+
+def get_user_profile(user_id: int) -> Optional[UserProfile]:
+    """Профиль пользователя из кэша или одним SELECT. None — пользователя нет в БД."""
+    found, profile = user_cache.get(user_id)
+    if found:
+        return profile
+    return load_user_profile(user_id)
+
 
 def user_exists(user_id: int) -> bool:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    exists = cursor.fetchone() is not None
-    conn.close()
-    return exists
+    return get_user_profile(user_id) is not None
 
 def add_user(user_id: int, username: Optional[str], language: str):
     """language: two-letter code (en, ru, es, ar)."""
     lang = (language or "en").strip().lower()[:2]
     if lang not in ("en", "ru", "es", "ar"):
         lang = "en"
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO users (user_id, username, language, verification_status, verification_pending) VALUES (?, ?, ?, 0, 0)",
-        (user_id, username, lang)
+    write_buffer.discard(user_id)
+    _execute(
+        "INSERT OR REPLACE INTO users (user_id, username, username_norm, language, verification_status, verification_pending) VALUES (?, ?, ?, ?, 0, 0)",
+        (user_id, username, _normalize_username(username), lang)
     )
-    conn.commit()
-    conn.close()
+    _invalidate(user_id)
 
 def update_user_language(user_id: int, username: Optional[str], language: str):
-    """Обновляет язык (двухбуквенный код) и username без изменения статуса верификации."""
+    """Обновляет язык (двухбуквенный код) и username без изменения статуса верификации.
+    Запись идёт через write_buffer и попадает в БД при ближайшем сбросе."""
     lang = (language or "en").strip().lower()[:2]
     if lang not in ("en", "ru", "es", "ar"):
         lang = "en"
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT verification_status, verification_pending FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    if result:
-        cursor.execute(
-            "UPDATE users SET username = ?, language = ? WHERE user_id = ?",
-            (username, lang, user_id)
-        )
-    else:
-        cursor.execute(
-            "INSERT INTO users (user_id, username, language, verification_status, verification_pending) VALUES (?, ?, ?, 0, 0)",
-            (user_id, username, lang)
-        )
-    
-    conn.commit()
-    conn.close()
+    write_buffer.put_upsert(user_id, username, _normalize_username(username), lang)
+    _invalidate(user_id)
 
 def update_language(user_id: int, language: str):
     lang = (language or "en").strip().lower()[:2]
     if lang not in ("en", "ru", "es", "ar"):
         lang = "en"
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET language = ? WHERE user_id = ?", (lang, user_id))
-    conn.commit()
-    conn.close()
+    write_buffer.put_fields(user_id, language=lang)
+    _invalidate(user_id)
 
 def get_user_language(user_id: int) -> str:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT language FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    raw = result[0] if result else "en"
-    raw = (raw or "en").strip().lower()
-    code_map = {"english": "en", "russian": "ru", "spanish": "es", "hindi": "en", "arabic": "ar"}
-    if raw in ("en", "ru", "es", "ar"):
-        return raw
-    return code_map.get(raw, "en")
+    profile = get_user_profile(user_id)
+    return profile.language if profile else DEFAULT_LANGUAGE
 
 def is_verification_pending(user_id: int) -> bool:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT verification_pending FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] == 1 if result else False
+    profile = get_user_profile(user_id)
+    return profile.pending if profile else False
 
 def set_verification_pending(user_id: int, pending: bool):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET verification_pending = ? WHERE user_id = ?", (1 if pending else 0, user_id))
-    conn.commit()
-    conn.close()
+    write_buffer.put_fields(user_id, verification_pending=1 if pending else 0)
+    _invalidate(user_id)
 
 def update_verification_status(user_id: int, status: bool):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET verification_status = ? WHERE user_id = ?", (1 if status else 0, user_id))
-    conn.commit()
-    conn.close()
+    write_buffer.put_fields(user_id, verification_status=1 if status else 0)
+    _invalidate(user_id)
 
 def is_verified(user_id: int) -> bool:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT verification_status FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] == 1 if result else False
+    profile = get_user_profile(user_id)
+    return profile.verified if profile else False
 
 def get_user_info(user_id: int) -> Optional[Tuple]:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, username FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    profile = get_user_profile(user_id)
+    return (profile.user_id, profile.username) if profile else None
 
 
 def get_user_id_by_username(username: str) -> Optional[int]:
-    """Возвращает user_id по username. В БД username хранится без @. Сравнение без учёта регистра."""
-    if not username or not username.strip():
-        return None
-    raw = username.strip().lstrip("@")
-    if not raw:
+    """Возвращает user_id по username. В БД username хранится без @. Сравнение без учёта регистра.
+    Поиск идёт по индексу idx_users_username_norm."""
+    # username меняется через write_buffer — сбрасываем его, чтобы искать по актуальным данным.
+    write_buffer.flush()
+    return find_user_id_by_username(username)
+
+
+def find_user_id_by_username(username: str) -> Optional[int]:
+    """Как get_user_id_by_username, но без сброса write_buffer — только чтение."""
+    norm = _normalize_username(username)
+    if not norm:
         return None
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT user_id FROM users WHERE LOWER(TRIM(username)) = LOWER(?)",
-        (raw,),
+    result = _fetchone(
+        "SELECT user_id FROM users WHERE username_norm = ?",
+        (norm,),
     )
-    result = cursor.fetchone()
-    conn.close()
     return result[0] if result else None
+
+def get_fsm_state(key: str, now: Optional[float] = None) -> Optional[str]:
+    row = _fetchone(
+        "SELECT state FROM fsm_state WHERE key = ? AND expires_at > ?",
+        (key, time.time() if now is None else now),
+    )
+    return row[0] if row else None
+
+
+def get_fsm_data(key: str, now: Optional[float] = None) -> Optional[str]:
+    """Данные FSM в виде JSON-строки или None."""
+    row = _fetchone(
+        "SELECT data FROM fsm_state WHERE key = ? AND expires_at > ?",
+        (key, time.time() if now is None else now),
+    )
+    return row[0] if row else None
+
+
+# Просроченная, но ещё не удалённая строка считается пустой.
+_FSM_SET_STATE_SQL = (
+    "INSERT INTO fsm_state (key, state, data, expires_at) VALUES (?, ?, '{}', ?) "
+    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at, "
+    "data = CASE WHEN fsm_state.expires_at > ? THEN fsm_state.data ELSE '{}' END"
+)
+_FSM_SET_DATA_SQL = (
+    "INSERT INTO fsm_state (key, state, data, expires_at) VALUES (?, NULL, ?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at, "
+    "state = CASE WHEN fsm_state.expires_at > ? THEN fsm_state.state ELSE NULL END"
+)
+_FSM_DELETE_EMPTY_SQL = "DELETE FROM fsm_state WHERE key = ? AND state IS NULL AND data = '{}'"
+
+
+def set_fsm_state(key: str, state: Optional[str], ttl: float = FSM_STATE_TTL) -> None:
+    now = time.time()
+    with _get_pool().writer() as conn:
+        conn.execute(_FSM_SET_STATE_SQL, (key, state, now + ttl, now))
+        if state is None:
+            conn.execute(_FSM_DELETE_EMPTY_SQL, (key,))
+
+
+def set_fsm_data(key: str, data: str, ttl: float = FSM_STATE_TTL) -> None:
+    """data — JSON-строка; пустые данные без состояния удаляют строку."""
+    now = time.time()
+    with _get_pool().writer() as conn:
+        conn.execute(_FSM_SET_DATA_SQL, (key, data, now + ttl, now))
+        if data == "{}":
+            conn.execute(_FSM_DELETE_EMPTY_SQL, (key,))
+
+
+def update_fsm_data(key: str, merge: Callable[[Optional[str]], str], ttl: float = FSM_STATE_TTL) -> str:
+    """
+    Читает и перезаписывает данные в одной транзакции BEGIN IMMEDIATE, поэтому
+    другие процессы с той же базой не потеряют параллельное обновление.
+    merge получает текущую JSON-строку (или None) и возвращает новую.
+    """
+    now = time.time()
+    with _get_pool().writer() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT data FROM fsm_state WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        data = merge(row[0] if row else None)
+        conn.execute(_FSM_SET_DATA_SQL, (key, data, now + ttl, now))
+        if data == "{}":
+            conn.execute(_FSM_DELETE_EMPTY_SQL, (key,))
+    return data
+
+
+def count_fsm_states(now: Optional[float] = None) -> int:
+    """Число живых состояний FSM (по индексу expires_at)."""
+    row = _fetchone("SELECT COUNT(*) FROM fsm_state WHERE expires_at > ?", (time.time() if now is None else now,))
+    return row[0]
+
+
+def delete_expired_fsm(batch_size: int = FSM_CLEANUP_BATCH_SIZE, now: Optional[float] = None) -> int:
+    """Удаляет одну пачку просроченных состояний по индексу expires_at. Возвращает число удалённых строк."""
+    with _get_pool().writer() as conn:
+        cursor = conn.execute(
+            "DELETE FROM fsm_state WHERE key IN (SELECT key FROM fsm_state WHERE expires_at <= ? LIMIT ?)",
+            (time.time() if now is None else now, batch_size),
+        )
+        return cursor.rowcount
+
+
+VERIFICATION_PENDING = "pending"
+VERIFICATION_APPROVED = "approved"
+VERIFICATION_REJECTED = "rejected"
+
+ASSIGN_LEAST_LOADED = "least_loaded"
+ASSIGN_ROUND_ROBIN = "round_robin"
+
+
+def _pick_moderator(
+    conn: sqlite3.Connection,
+    moderators: Sequence[int],
+    strategy: str,
+    exclude: Optional[int] = None,
+) -> Optional[int]:
+    """
+    Модератор для заявки; вызывается внутри транзакции записи, поэтому выбор не гоняется с другими.
+    None — в пуле нет никого, кроме exclude.
+    """
+    candidates = [m for m in moderators if m != exclude]
+    if not candidates:
+        return None
+    if len(candidates) == 1:
+        return candidates[0]
+    if strategy == ASSIGN_ROUND_ROBIN:
+        # Следующий по кругу после модератора самой новой заявки
+        row = conn.execute(
+            "SELECT assigned_to FROM verification_requests WHERE assigned_to IS NOT NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        start = moderators.index(row[0]) + 1 if row and row[0] in moderators else 0
+        return next(m for m in (*moderators[start:], *moderators[:start]) if m in candidates)
+    # Меньше всего открытых заявок; при равенстве — порядок пула
+    counts = dict(conn.execute(
+        f"SELECT assigned_to, COUNT(*) FROM verification_requests "
+        f"WHERE assigned_to IN ({', '.join('?' * len(candidates))}) AND status = 'pending' GROUP BY assigned_to",
+        candidates,
+    ).fetchall())
+    return min(candidates, key=lambda m: counts.get(m, 0))
+
+
+# (file_unique_id, file_id, тип: photo/video)
+MediaRecord = Tuple[str, str, str]
+
+
+def _set_user_flags(conn: sqlite3.Connection, user_ids: Iterable[int], **fields) -> None:
+    """
+    Колонки users в транзакции conn (вызывать внутри write_buffer.paused()), чтобы флаги
+    верификации не зависели от сброса буфера. Несброшенные значения этих колонок
+    отбрасываются; если строки ещё нет (её вставка ждёт в буфере), значение идёт в буфер после неё.
+    """
+    columns = sorted(fields)
+    sql = f"UPDATE users SET {', '.join(f'{c} = ?' for c in columns)} WHERE user_id = ?"
+    values = tuple(fields[c] for c in columns)
+    for user_id in user_ids:
+        if conn.execute(sql, (*values, user_id)).rowcount:
+            write_buffer.discard_fields(user_id, *columns)
+        else:
+            write_buffer.put_fields(user_id, **fields)
+
+
+def submit_verification_request(
+    user_id: int,
+    username: Optional[str],
+    moderators: Sequence[int] = (),
+    strategy: str = ASSIGN_LEAST_LOADED,
+) -> Tuple[int, Optional[int], bool]:
+    """
+    Ставит заявку пользователя в очередь модерации (если у него ещё нет ожидающей),
+    назначает её модератору из moderators и в той же транзакции выставляет
+    users.verification_pending. Файлы заявки записывает record_verification_media()
+    после того, как они дошли до модератора.
+    Возвращает (id заявки, модератор, создана ли заявка этим вызовом); повторная
+    отправка остаётся у прежнего модератора. Если отправить новую заявку модератору
+    не удалось, её снимает withdraw_verification_request().
+    """
+    now = time.time()
+    with write_buffer.paused(), _get_pool().writer() as conn:
+        row = conn.execute(
+            "SELECT id, assigned_to FROM verification_requests WHERE user_id = ? AND status = 'pending'",
+            (user_id,),
+        ).fetchone()
+        created = row is None
+        if row and (row[1] is not None or not moderators):
+            request_id, moderator = row
+        else:
+            moderator = _pick_moderator(conn, moderators, strategy) if moderators else None
+            if row:
+                request_id = row[0]
+                conn.execute(
+                    "UPDATE verification_requests SET assigned_to = ?, assigned_at = ? WHERE id = ?",
+                    (moderator, now, request_id),
+                )
+            else:
+                request_id = conn.execute(
+                    "INSERT INTO verification_requests (user_id, username, status, submitted_at, assigned_to, assigned_at) "
+                    "VALUES (?, ?, 'pending', ?, ?, ?)",
+                    (user_id, username, now, moderator, now if moderator is not None else 0),
+                ).lastrowid
+        _set_user_flags(conn, (user_id,), verification_pending=1)
+    _invalidate(user_id)
+    return request_id, moderator, created
+
+
+def withdraw_verification_request(request_id: int, user_id: int) -> bool:
+    """
+    Удаляет ожидающую заявку, которую не удалось отправить модератору, вместе с её
+    файлами и снимает users.verification_pending — пользователь может прислать файлы снова.
+    False — заявки уже нет или по ней успели принять решение.
+    """
+    with write_buffer.paused(), _get_pool().writer() as conn:
+        if not conn.execute(
+            "DELETE FROM verification_requests WHERE id = ? AND user_id = ? AND status = 'pending'",
+            (request_id, user_id),
+        ).rowcount:
+            return False
+        conn.execute("DELETE FROM verification_media WHERE request_id = ?", (request_id,))
+        _set_user_flags(conn, (user_id,), verification_pending=0)
+    _invalidate(user_id)
+    return True
+
+
+def record_verification_media(request_id: int, user_id: int, media: Sequence[MediaRecord]) -> None:
+    """
+    Сохраняет файлы заявки, отправленные модератору. Вызывается после успешной
+    пересылки: файл, который модератор не получил, не считается присланным.
+    Уже известные file_unique_id остаются за первой заявкой.
+    """
+    if not media:
+        return
+    now = time.time()
+    with _get_pool().writer() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO verification_media "
+            "(file_unique_id, user_id, request_id, file_id, media_type, submitted_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ((unique_id, user_id, request_id, file_id, media_type, now) for unique_id, file_id, media_type in media),
+        )
+
+
+def reassign_stale_verifications(
+    moderators: Sequence[int],
+    older_than: float,
+    strategy: str = ASSIGN_LEAST_LOADED,
+    limit: int = 100,
+    max_reassignments: int = 3,
+) -> List[Tuple[int, int, Optional[str], Optional[int], int]]:
+    """
+    Переназначает до limit ожидающих заявок без модератора, с модератором не из пула
+    или (если в пуле есть кому передать) назначенных раньше older_than секунд назад.
+    По таймауту заявку передают не больше max_reassignments раз, дальше она остаётся
+    у последнего модератора.
+    Возвращает (id заявки, user_id, username, прежний, новый).
+    """
+    if not moderators:
+        return []
+    now = time.time()
+    where = f"assigned_to IS NULL OR assigned_to NOT IN ({', '.join('?' * len(moderators))})"
+    params = [*moderators]
+    if len(moderators) > 1:
+        # В пуле из одного чата передать некому: зависшая заявка остаётся на месте
+        where += " OR (assigned_at < ? AND reassign_count < ?)"
+        params += [now - older_than, max_reassignments]
+    reassigned = []
+    with _get_pool().writer() as conn:
+        rows = conn.execute(
+            f"SELECT id, user_id, username, assigned_to FROM verification_requests "
+            f"WHERE status = 'pending' AND ({where}) ORDER BY assigned_at LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        for request_id, user_id, username, previous in rows:
+            moderator = _pick_moderator(conn, moderators, strategy, exclude=previous)
+            if moderator is None:
+                continue
+            conn.execute(
+                "UPDATE verification_requests SET assigned_to = ?, assigned_at = ?, "
+                "reassign_count = reassign_count + 1 WHERE id = ?",
+                (moderator, now, request_id),
+            )
+            reassigned.append((request_id, user_id, username, previous, moderator))
+    return reassigned
+
+
+def adopt_unassigned_verifications(moderator: int) -> int:
+    """
+    Назначает moderator ожидающие заявки без модератора — поданные до пула модераторов,
+    когда карточки уходили в один чат. Без новой отправки: карточка уже в этом чате.
+    Отсчёт до переназначения начинается заново. Возвращает число заявок.
+    """
+    with _get_pool().writer() as conn:
+        return conn.execute(
+            "UPDATE verification_requests SET assigned_to = ?, assigned_at = ? "
+            "WHERE status = 'pending' AND assigned_to IS NULL",
+            (moderator, time.time()),
+        ).rowcount
+
+
+def decide_verification(user_id: int, approved: bool, moderator_id: Optional[int] = None) -> Tuple[bool, Optional[str]]:
+    """
+    Переход pending -> approved/rejected одной заявки условным UPDATE.
+    Возвращает (True, новый статус), если переход сделал этот вызов, иначе
+    (False, статус последней заявки пользователя или None, если заявок не было).
+    Двойное нажатие и одновременные approve/reject дают ровно одного победителя.
+    """
+    status = VERIFICATION_APPROVED if approved else VERIFICATION_REJECTED
+    with write_buffer.paused(), _get_pool().writer() as conn:
+        won = conn.execute(
+            "UPDATE verification_requests SET status = ?, decided_at = ?, decided_by = ? "
+            "WHERE user_id = ? AND status = 'pending' RETURNING id",
+            (status, time.time(), moderator_id, user_id),
+        ).fetchall()
+        if not won:
+            row = conn.execute(
+                "SELECT status FROM verification_requests WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+                (user_id,),
+            ).fetchone()
+            return False, row[0] if row else None
+        _set_user_flags(conn, (user_id,), verification_status=1 if approved else 0, verification_pending=0)
+    _invalidate(user_id)
+    return True, status
+
+
+def decide_verifications(user_ids: Iterable[int], approved: bool, moderator_id: Optional[int] = None) -> List[int]:
+    """
+    Закрывает ожидающие заявки пользователей и обновляет их статус верификации
+    одной транзакцией. Возвращает user_id, у которых действительно была ожидающая заявка.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return []
+    status = VERIFICATION_APPROVED if approved else VERIFICATION_REJECTED
+    now = time.time()
+    decided = set()
+    with write_buffer.paused(), _get_pool().writer() as conn:
+        # Пачками, чтобы не упереться в лимит параметров SQLite
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            rows = conn.execute(
+                f"UPDATE verification_requests SET status = ?, decided_at = ?, decided_by = ? "
+                f"WHERE status = 'pending' AND user_id IN ({', '.join('?' * len(chunk))}) RETURNING user_id",
+                (status, now, moderator_id, *chunk),
+            ).fetchall()
+            decided.update(r[0] for r in rows)
+        # Флаги только у тех, чью заявку закрыл этот вызов
+        _set_user_flags(conn, decided, verification_status=1 if approved else 0, verification_pending=0)
+    for user_id in decided:
+        _invalidate(user_id)
+    return sorted(decided)
+
+
+def list_pending_verifications(
+    limit: int,
+    offset: int = 0,
+    assigned_to: Optional[int] = None,
+) -> Tuple[int, List[Tuple[int, Optional[str], float]]]:
+    """
+    Число ожидающих заявок и страница (user_id, username, submitted_at), старые первыми.
+    assigned_to — только очередь этого модератора.
+    """
+    where, params = "status = 'pending'", ()
+    if assigned_to is not None:
+        where, params = "assigned_to = ? AND status = 'pending'", (assigned_to,)
+    with _get_pool().reader() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM verification_requests WHERE {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT user_id, username, submitted_at FROM verification_requests "
+            f"WHERE {where} ORDER BY submitted_at, id LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+    return total, rows
+
+
+def find_verification_media(file_unique_ids: Sequence[str]) -> Dict[str, Tuple[int, Optional[str]]]:
+    """
+    Уже присланные файлы из file_unique_ids: file_unique_id -> (user_id, статус заявки).
+    Поиск по первичному ключу, стоимость не зависит от числа сохранённых файлов.
+    """
+    if not file_unique_ids:
+        return {}
+    with _get_pool().reader() as conn:
+        rows = conn.execute(
+            f"SELECT m.file_unique_id, m.user_id, r.status FROM verification_media m "
+            f"LEFT JOIN verification_requests r ON r.id = m.request_id "
+            f"WHERE m.file_unique_id IN ({', '.join('?' * len(file_unique_ids))})",
+            tuple(file_unique_ids),
+        ).fetchall()
+    return {unique_id: (user_id, status) for unique_id, user_id, status in rows}
+
+
+def list_request_media(request_id: int) -> List[MediaRecord]:
+    """Файлы заявки (file_unique_id, file_id, тип) в порядке отправки."""
+    with _get_pool().reader() as conn:
+        return conn.execute(
+            "SELECT file_unique_id, file_id, media_type FROM verification_media "
+            "WHERE request_id = ? ORDER BY submitted_at",
+            (request_id,),
+        ).fetchall()
+
+
+def moderator_stats(since: float) -> Dict[int, Tuple[int, int, Optional[float]]]:
+    """
+    По модераторам: (открытых заявок, решённых из поданных после since,
+    среднее время от назначения до решения в секундах).
+    """
+    stats: Dict[int, list] = {}
+    with _get_pool().reader() as conn:
+        for moderator, count in conn.execute(
+            "SELECT assigned_to, COUNT(*) FROM verification_requests "
+            "WHERE status = 'pending' AND assigned_to IS NOT NULL GROUP BY assigned_to"
+        ):
+            stats[moderator] = [count, 0, None]
+        # Диапазон по индексу (status, submitted_at) вместо полного прохода по истории
+        for moderator, count, seconds in conn.execute(
+            "SELECT assigned_to, COUNT(*), AVG(decided_at - assigned_at) FROM verification_requests "
+            "WHERE status IN (?, ?) AND submitted_at >= ? AND assigned_to IS NOT NULL GROUP BY assigned_to",
+            (VERIFICATION_APPROVED, VERIFICATION_REJECTED, since),
+        ):
+            entry = stats.setdefault(moderator, [0, 0, None])
+            entry[1], entry[2] = count, seconds
+    return {moderator: tuple(entry) for moderator, entry in stats.items()}
+
+
+# METRICS_PORT: время каждой публичной функции модуля и сброса write-behind буфера.
+# Должно оставаться в конце модуля, после всех функций.
+if metrics.ENABLED:
+    metrics.instrument_module(globals(), extra=("_flush_writes",))
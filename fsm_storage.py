@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+FSM-хранилище aiogram в users.db (таблица fsm_state, миграция 3).
+
+В отличие от MemoryStorage состояния переживают рестарт и общие для всех
+процессов, работающих с одной базой. Запросы идут через пул соединений
+database.py и потоки async_db. Каждая запись продлевает срок жизни состояния
+на ttl; просроченные строки не читаются и удаляются пачками в run_cleanup().
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import async_db
+import database
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_INTERVAL = 600.0
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, ttl: float = database.FSM_STATE_TTL, key_builder: Optional[KeyBuilder] = None):
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.cleaned = 0
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await async_db.set_fsm_state(self._key(key), value, self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await async_db.get_fsm_state(self._key(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await async_db.set_fsm_data(self._key(key), json.dumps(dict(data), ensure_ascii=False), self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        raw = await async_db.get_fsm_data(self._key(key))
+        return json.loads(raw) if raw else {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        """Чтение и запись в одной транзакции, без гонки между процессами."""
+        def merge(raw: Optional[str]) -> str:
+            current = json.loads(raw) if raw else {}
+            current.update(data)
+            return json.dumps(current, ensure_ascii=False)
+
+        return json.loads(await async_db.update_fsm_data(self._key(key), merge, self.ttl))
+
+    async def cleanup(self, batch_size: int = database.FSM_CLEANUP_BATCH_SIZE) -> int:
+        """Удаляет все просроченные состояния пачками, отпуская писателя между ними."""
+        total = 0
+        while True:
+            deleted = await async_db.delete_expired_fsm(batch_size)
+            total += deleted
+            if deleted < batch_size:
+                break
+            await asyncio.sleep(0)
+        self.cleaned += total
+        return total
+
+    async def run_cleanup(self, interval: float = CLEANUP_INTERVAL) -> None:
+        """Периодическая очистка; запускается задачей из bot.py."""
+        while True:
+            try:
+                deleted = await self.cleanup()
+                if deleted:
+                    logger.info("Removed %s expired FSM states", deleted)
+            except Exception:
+                logger.exception("FSM cleanup failed")
+            await asyncio.sleep(interval)
+
+    async def stats(self) -> dict:
+        return {"states": await async_db.count_fsm_states(), "cleaned": self.cleaned}
+
+    async def close(self) -> None:
+        # Соединения принадлежат пулу database.py и закрываются в async_db.shutdown().
+        pass
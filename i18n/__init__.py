@@ -1,26 +1,213 @@
 # -*- coding: utf-8 -*-
-"""Локализация: загрузка JSON и функция S(key, lang_code)."""
+"""
+Локализация: загрузка JSON и функция S(key, lang_code).
+
+Все локали загружаются один раз при импорте и сливаются с en (fallback) в
+плоские таблицы — S() делает один поиск в словаре. Строки с плейсхолдерами
+доступны как готовые шаблоны через T(key, lang_code)(**kwargs).
+
+watch_locales() следит за mtime JSON-файлов и через reload() подменяет
+каталог целиком одним присваиванием: хендлеры видят либо старые таблицы,
+либо новые, но не наполовину загруженные. Каталог с ошибками не
+устанавливается — остаётся предыдущий.
+"""
+import asyncio
 import json
+import logging
 import os
+import string
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 _LOCALE_DIR = os.path.join(os.path.dirname(__file__))
-_CACHE = {}
 _SUPPORTED = ("en", "ru", "es", "ar")
 _DEFAULT = "en"
 
 
-def _load(lang_code: str) -> dict:
-    lang_code = (lang_code or "").strip().lower()[:2]
-    if lang_code not in _SUPPORTED:
-        lang_code = _DEFAULT
-    if lang_code not in _CACHE:
-        path = os.path.join(_LOCALE_DIR, f"{lang_code}.json")
+def _path(lang_code: str) -> str:
+    return os.path.join(_LOCALE_DIR, f"{lang_code}.json")
+
+
+def _read(lang_code: str) -> dict:
+    with open(_path(lang_code), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{_path(lang_code)}: expected a JSON object")
+    return data
+
+
+def _placeholders(text: str) -> frozenset:
+    return frozenset(name for _, name, _, _ in string.Formatter().parse(text) if name is not None)
+
+
+def _check(raw: Dict[str, dict]) -> Tuple[List[str], List[str]]:
+    """(ошибки, предупреждения). Отсутствующие и лишние ключи — предупреждения: их покрывает fallback на en."""
+    errors, warnings = [], []
+    base = raw.get(_DEFAULT, {})
+    for lang_code in _SUPPORTED:
+        data = raw.get(lang_code, {})
+        for key in base.keys() - data.keys():
+            warnings.append(f"{lang_code}: missing key {key!r}")
+        for key in data.keys() - base.keys():
+            warnings.append(f"{lang_code}: unknown key {key!r}")
+        for key, text in data.items():
+            if not isinstance(text, str):
+                errors.append(f"{lang_code}: {key!r} is not a string")
+                continue
+            try:
+                names = _placeholders(text)
+                expected = _placeholders(base[key]) if key in base else names
+            except ValueError as e:
+                errors.append(f"{lang_code}: {key!r} is not a valid template ({e})")
+                continue
+            if names != expected:
+                errors.append(
+                    f"{lang_code}: {key!r} placeholders {sorted(names)} != {sorted(expected)} in {_DEFAULT}"
+                )
+    return errors, warnings
+
+
+def validate(raw: Dict[str, dict]) -> List[str]:
+    """
+    Проверяет локали относительно en: отсутствующие и лишние ключи,
+    несовпадающие плейсхолдеры, некорректные шаблоны. Возвращает список проблем.
+    """
+    errors, warnings = _check(raw)
+    return errors + warnings
+
+
+class Catalog:
+    """Скомпилированные локали: плоские таблицы с fallback и шаблоны строк с плейсхолдерами."""
+
+    __slots__ = ("tables", "templates", "errors", "warnings")
+
+    def __init__(self, raw: Dict[str, dict], errors: Optional[List[str]] = None):
+        self.errors, self.warnings = _check(raw)
+        if errors:
+            self.errors = errors + self.errors
+        base = {k: v for k, v in raw.get(_DEFAULT, {}).items() if isinstance(v, str)}
+        self.tables: Dict[str, Dict[str, str]] = {}
+        self.templates: Dict[str, Dict[str, Callable[..., str]]] = {}
+        for lang_code in _SUPPORTED:
+            table = dict(base)
+            table.update((k, v) for k, v in raw.get(lang_code, {}).items() if isinstance(v, str))
+            self.tables[lang_code] = table
+            self.templates[lang_code] = {k: v.format for k, v in table.items() if "{" in v}
+
+    @property
+    def problems(self) -> List[str]:
+        return self.errors + self.warnings
+
+
+def build_catalog() -> Catalog:
+    """Читает и компилирует все локали. Нечитаемый файл — ошибка каталога, язык остаётся на fallback."""
+    raw, errors = {}, []
+    for lang_code in _SUPPORTED:
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                _CACHE[lang_code] = json.load(f)
+            raw[lang_code] = _read(lang_code)
+        except Exception as e:
+            errors.append(f"{lang_code}: failed to load {_path(lang_code)} ({e})")
+            raw[lang_code] = {}
+    return Catalog(raw, errors)
+
+
+def _log_problems(catalog: Catalog) -> None:
+    for problem in catalog.errors:
+        logger.error("i18n: %s", problem)
+    for problem in catalog.warnings:
+        logger.warning("i18n: %s", problem)
+
+
+_catalog: Catalog
+_TABLES: Dict[str, Dict[str, str]]
+_TEMPLATES: Dict[str, Dict[str, Callable[..., str]]]
+_reload_callbacks: List[Callable[[], None]] = []
+
+reload_count = 0
+reload_failures = 0
+last_reload: Optional[float] = None
+
+
+def _install(catalog: Catalog) -> None:
+    global _catalog, _TABLES, _TEMPLATES
+    _catalog, _TABLES, _TEMPLATES = catalog, catalog.tables, catalog.templates
+
+
+def on_reload(callback: Callable[[], None]) -> Callable[[], None]:
+    """Регистрирует функцию, вызываемую после установки нового каталога (например, пересборка клавиатур)."""
+    _reload_callbacks.append(callback)
+    return callback
+
+
+def reload(catalog: Optional[Catalog] = None) -> bool:
+    """
+    Устанавливает свежепрочитанный каталог, если в нём нет ошибок. Возвращает True при успехе.
+    catalog можно собрать заранее (build_catalog() в потоке), тогда здесь только проверка и подмена.
+    """
+    global reload_count, reload_failures, last_reload
+    if catalog is None:
+        catalog = build_catalog()
+    _log_problems(catalog)
+    if catalog.errors:
+        reload_failures += 1
+        logger.error("i18n: reload rejected, keeping the previous catalog")
+        return False
+    _install(catalog)
+    reload_count += 1
+    last_reload = time.time()
+    logger.info("i18n: locales reloaded (%s)", ", ".join(f"{k}={len(v)}" for k, v in catalog.tables.items()))
+    for callback in _reload_callbacks:
+        try:
+            callback()
         except Exception:
-            _CACHE[lang_code] = {}
-    return _CACHE[lang_code]
+            logger.exception("i18n: reload callback %r failed", callback)
+    return True
+
+
+def _mtimes() -> Dict[str, Optional[int]]:
+    out = {}
+    for lang_code in _SUPPORTED:
+        try:
+            out[lang_code] = os.stat(_path(lang_code)).st_mtime_ns
+        except OSError:
+            out[lang_code] = None
+    return out
+
+
+async def watch_locales(interval: float = 2.0) -> None:
+    """Фоновая задача: раз в interval секунд сверяет mtime файлов и перезагружает каталог при изменении."""
+    seen = _mtimes()
+    while True:
+        await asyncio.sleep(interval)
+        current = _mtimes()
+        if current == seen:
+            continue
+        seen = current
+        try:
+            catalog = await asyncio.to_thread(build_catalog)
+        except Exception:
+            logger.exception("i18n: failed to build catalog")
+            continue
+        reload(catalog)
+
+
+def stats() -> dict:
+    return {
+        "reload_count": reload_count,
+        "reload_failures": reload_failures,
+        "last_reload": last_reload,
+    }
+
+
+_install(build_catalog())
+_log_problems(_catalog)
+
+
+def _resolve(lang_code: str) -> str:
+    code = (lang_code or "").strip().lower()[:2] if lang_code else _DEFAULT
+    return code if code in _SUPPORTED else _DEFAULT
 
 
 def S(text: str, lang_code: str) -> str:
@@ -29,14 +216,18 @@ def S(text: str, lang_code: str) -> str:
     lang_code — двухбуквенный код: en, ru, es, ar.
     Если перевода нет, возвращается значение из en, затем сам ключ.
     """
-    code = (lang_code or "").strip().lower()[:2] if lang_code else _DEFAULT
-    if code not in _SUPPORTED:
-        code = _DEFAULT
-    data = _load(code)
-    out = data.get(text)
-    if out is not None:
-        return out
-    if code != _DEFAULT:
-        data_en = _load(_DEFAULT)
-        out = data_en.get(text)
-    return out if out is not None else text
+    table = _TABLES.get(lang_code)
+    if table is None:
+        table = _TABLES[_resolve(lang_code)]
+    return table.get(text, text)
+
+
+def T(text: str, lang_code: str) -> Callable[..., str]:
+    """Шаблон строки text для lang_code: T("verification_done", "ru")(username=..., status=...)."""
+    templates = _TEMPLATES.get(lang_code)
+    if templates is None:
+        templates = _TEMPLATES[_resolve(lang_code)]
+    template = templates.get(text)
+    if template is None:
+        template = S(text, lang_code).format
+    return template
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Реестр inline-клавиатур.
+
+Клавиатуры, зависящие только от языка, собираются один раз на язык при
+импорте и заново после перезагрузки локалей (i18n.on_reload). Хендлеры
+получают общие экземпляры — их нельзя изменять, поэтому разметка заморожена.
+Клавиатуры с данными пользователя (approve_/reject_ модератора) получаются
+копированием заготовки с подстановкой callback_data — без InlineKeyboardBuilder
+и повторной валидации.
+"""
+from typing import Dict, List
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pydantic import ConfigDict
+
+import i18n
+from i18n import S
+
+SUPPORT_URL = "https://t.me/ScannerManager"
+REGISTER_URL = "https://u3.shortink.io/register?utm_campaign=839002&utm_source=affiliate&utm_medium=sr&a=NUYNmfmAkKYMaY&ac=scanner-trade-bot&code=ROS149"
+
+
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """InlineKeyboardMarkup, который нельзя случайно изменить: экземпляр общий для всех апдейтов."""
+
+    model_config = ConfigDict(**{**InlineKeyboardMarkup.model_config, "frozen": True})
+
+
+def _markup(rows: List[List[InlineKeyboardButton]]) -> FrozenInlineKeyboardMarkup:
+    return FrozenInlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def _build_language() -> FrozenInlineKeyboardMarkup:
+    return _markup([
+        [
+            InlineKeyboardButton(text=S("btn_english", "en"), callback_data="lang_en"),
+            InlineKeyboardButton(text=S("btn_russian", "ru"), callback_data="lang_ru"),
+        ],
+        [
+            InlineKeyboardButton(text=S("btn_spanish", "es"), callback_data="lang_es"),
+            InlineKeyboardButton(text=S("btn_arabic", "ar"), callback_data="lang_ar"),
+        ],
+    ])
+
+
+def _build_main_menu(lang: str) -> FrozenInlineKeyboardMarkup:
+    return _markup([
+        [InlineKeyboardButton(text=S("btn_get_signals", lang), callback_data="get_signals")],
+        [
+            InlineKeyboardButton(text=S("btn_language", lang), callback_data="selecting_lang"),
+            InlineKeyboardButton(text=S("btn_support", lang), url=SUPPORT_URL),
+        ],
+    ])
+
+
+def _build_unauthorized(lang: str) -> FrozenInlineKeyboardMarkup:
+    return _markup([
+        [InlineKeyboardButton(text=S("btn_create_account", lang), url=REGISTER_URL)],
+        [InlineKeyboardButton(text=S("btn_verify_account", lang), callback_data="verify_account")],
+    ])
+
+
+def _build_accepted(lang: str) -> FrozenInlineKeyboardMarkup:
+    return _markup([[InlineKeyboardButton(text=S("btn_get_signals", lang), callback_data="get_signals")]])
+
+
+_language: FrozenInlineKeyboardMarkup
+_by_lang: Dict[str, Dict[str, FrozenInlineKeyboardMarkup]]
+_review_templates: Dict[str, InlineKeyboardMarkup]
+
+
+def rebuild() -> None:
+    """Пересобирает все клавиатуры и подменяет реестр целиком."""
+    global _language, _by_lang, _review_templates
+    by_lang = {}
+    review_templates = {}
+    for lang in i18n._SUPPORTED:
+        by_lang[lang] = {
+            "main_menu": _build_main_menu(lang),
+            "unauthorized": _build_unauthorized(lang),
+            "accepted": _build_accepted(lang),
+        }
+        review_templates[lang] = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text=S("btn_approve", lang), callback_data="approve_0"),
+            InlineKeyboardButton(text=S("btn_reject", lang), callback_data="reject_0"),
+        ]])
+    _language, _by_lang, _review_templates = _build_language(), by_lang, review_templates
+
+
+def _get(name: str, lang: str) -> FrozenInlineKeyboardMarkup:
+    keyboards = _by_lang.get(lang) or _by_lang[i18n._resolve(lang)]
+    return keyboards[name]
+
+
+def language_keyboard() -> FrozenInlineKeyboardMarkup:
+    return _language
+
+
+def main_menu_keyboard(lang: str) -> FrozenInlineKeyboardMarkup:
+    return _get("main_menu", lang)
+
+
+def unauthorized_keyboard(lang: str) -> FrozenInlineKeyboardMarkup:
+    return _get("unauthorized", lang)
+
+
+def accepted_keyboard(lang: str) -> FrozenInlineKeyboardMarkup:
+    return _get("accepted", lang)
+
+
+def review_keyboard(user_id: int, lang: str) -> InlineKeyboardMarkup:
+    """Кнопки модератора approve_{user_id}/reject_{user_id}: копия заготовки для языка."""
+    template = _review_templates.get(lang) or _review_templates[i18n._resolve(lang)]
+    approve, reject = template.inline_keyboard[0]
+    return template.model_copy(update={"inline_keyboard": [[
+        approve.model_copy(update={"callback_data": f"approve_{user_id}"}),
+        reject.model_copy(update={"callback_data": f"reject_{user_id}"}),
+    ]]})
+
+
+def pending_keyboard(page: int, pages: int) -> InlineKeyboardMarkup:
+    """Кнопки листания /pending (pending_page_{n}); на единственной странице кнопок нет."""
+    row = []
+    if page > 1:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=f"pending_page_{page - 1}"))
+    if page < pages:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=f"pending_page_{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row] if row else [])
+
+
+rebuild()
+i18n.on_reload(rebuild)
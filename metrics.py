@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики в текстовом формате Prometheus.
+
+Включаются переменной METRICS_PORT (например, METRICS_PORT=9100): тогда
+bot.py поднимает HTTP-эндпоинт GET /metrics и подключает инструменты:
+
+- bot_handler_seconds{handler,event} — время хендлеров роутера commands.dp;
+- bot_db_seconds{function} — время каждой функции database.py;
+- bot_api_seconds{method}, bot_api_errors_total{method,error} — вызовы Bot API;
+- gauges из stats() модулей: альбомы, кэш профилей, write-behind буфер, FSM,
+  планировщик отправки, троттлинг и т.д. Они считаются в момент запроса /metrics.
+
+Без METRICS_PORT ничего не оборачивается и не регистрируется, так что на
+горячем пути нет даже проверки флага.
+"""
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from aiogram import BaseMiddleware, Router
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+PORT = int(os.environ.get("METRICS_PORT", "0") or 0)
+HOST = os.environ.get("METRICS_HOST", "0.0.0.0")
+ENABLED = PORT > 0
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        # labels -> [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: Any) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+handler_seconds = Histogram("bot_handler_seconds", "Handler latency", ("handler", "event"))
+handler_errors = Counter("bot_handler_errors_total", "Handler exceptions", ("handler", "event"))
+db_seconds = Histogram("bot_db_seconds", "database.py function latency", ("function",))
+db_errors = Counter("bot_db_errors_total", "database.py function exceptions", ("function",))
+api_seconds = Histogram("bot_api_seconds", "Bot API request latency", ("method",))
+api_errors = Counter("bot_api_errors_total", "Bot API request errors", ("method", "error"))
+
+_METRICS = [handler_seconds, handler_errors, db_seconds, db_errors, api_seconds, api_errors]
+_GAUGES: List[Tuple[str, Callable[[], Any]]] = []
+
+
+# --- database.py ---
+
+def _timed(func: Callable, name: str) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            db_errors.inc(name)
+            raise
+        finally:
+            db_seconds.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+def instrument_module(namespace: Dict[str, Any], extra: Iterable[str] = ()) -> None:
+    """
+    Оборачивает замером времени все публичные функции модуля (и имена из extra).
+    Вызывается в конце модуля с globals(), до того как функции импортируют другие модули.
+    """
+    module = namespace["__name__"]
+    names = [
+        name for name, value in namespace.items()
+        if inspect.isfunction(value) and value.__module__ == module and not name.startswith("_")
+    ]
+    for name in [*names, *extra]:
+        namespace[name] = _timed(namespace[name], name)
+
+
+# --- commands.dp ---
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: время от входа в хендлер до выхода, по имени функции хендлера."""
+
+    def __init__(self, event_type: str):
+        self.event_type = event_type
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name, self.event_type)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name, self.event_type)
+
+
+def instrument_router(router: Router) -> None:
+    router.message.middleware(HandlerMetricsMiddleware("message"))
+    router.callback_query.middleware(HandlerMetricsMiddleware("callback_query"))
+
+
+# --- Bot API ---
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Request-middleware сессии. Регистрируется после SendScheduler, поэтому
+    меряет сам запрос к Telegram без ожидания в очереди планировщика.
+    """
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod) -> Response:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - started, name)
+
+
+# --- gauges ---
+
+def register_gauges(prefix: str, stats: Callable[[], Any]) -> None:
+    """
+    Числовые значения из stats() (dict, функция может быть async) становятся
+    gauge {prefix}_{key}; вложенный dict — gauge с меткой key.
+    """
+    _GAUGES.append((prefix, stats))
+
+
+def _render_gauges(prefix: str, values: Dict[str, Any]) -> List[str]:
+    lines = []
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            series = [(k, v) for k, v in value.items() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+            if series:
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f'{name}{{key="{_escape(k)}"}} {v}' for k, v in series)
+        elif isinstance(value, (int, float)):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {float(value)}")
+    return lines
+
+
+async def render() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for prefix, stats in _GAUGES:
+        try:
+            values = stats()
+            if inspect.isawaitable(values):
+                values = await values
+            lines.extend(_render_gauges(prefix, values or {}))
+        except Exception:
+            logger.exception("Failed to collect %s gauges", prefix)
+    return "\n".join(lines) + "\n"
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(text=await render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str = HOST, port: int = PORT) -> web.AppRunner:
+    """Поднимает GET /metrics; возвращает runner для остановки (runner.cleanup())."""
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics endpoint on %s:%s/metrics", host, port)
+    return runner
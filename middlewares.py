@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Middleware роутера commands.dp и Dispatcher.update (см. bot.py)."""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Chat, Message, TelegramObject, Update, User
+
+from async_db import get_user_profile, load_user_profile
+from database import DEFAULT_LANGUAGE, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Класс апдейта -> (токенов в секунду, размер всплеска). Всплеск media вмещает альбом из 10 файлов.
+THROTTLE_LIMITS = {
+    "media": (0.5, 12),
+    "text": (1.0, 5),
+    "callback": (2.0, 8),
+}
+THROTTLE_MAX_BUCKETS = 100_000
+# За это время любой бакет успевает наполниться, так что хранить его дальше незачем.
+THROTTLE_IDLE_TTL = 60.0
+# Сколько последних update_id помнит UpdateDeduplicationMiddleware
+UPDATE_DEDUP_SIZE = 10_000
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Один раз на апдейт загружает профиль отправителя и передаёт в хендлеры:
+    profile (UserProfile или None), lang, verified, pending.
+    Хендлерам на чтение больше не нужно ходить в БД. Незнакомый пользователь
+    кэшируется как None, так что его апдейты обращаются к SQLite не чаще
+    одного раза за TTL кэша.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        profile = await get_user_profile(user.id) if user is not None else None
+        _put_profile(data, profile)
+        return await handler(event, data)
+
+
+def _put_profile(data: Dict[str, Any], profile: Optional[UserProfile]) -> None:
+    data["profile"] = profile
+    data["lang"] = profile.language if profile else DEFAULT_LANGUAGE
+    data["verified"] = bool(profile and profile.verified)
+    data["pending"] = bool(profile and profile.pending)
+
+
+class FreshVerificationMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: для хендлеров с флагом fresh_verification (проверки
+    верификации и доступа к сигналам) перечитывает профиль из БД мимо кэша.
+    Кэш профилей у каждого процесса свой, и решение модератора, принятое другим
+    процессом с той же users.db (несколько инстансов в режиме webhook), иначе
+    дошло бы сюда только по истечении USER_CACHE_TTL. Один SELECT по ключу.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if user is not None and get_flag(data, "fresh_verification"):
+            _put_profile(data, await load_user_profile(user.id))
+        return await handler(event, data)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты апдейтов от одного пользователя: токен-бакет на пару
+    (user_id, класс апдейта) с отдельными лимитами для media, text и callback.
+    Регистрируется раньше UserContextMiddleware, поэтому лишний апдейт не
+    доходит ни до БД, ни до хендлера: сообщение отбрасывается, на callback
+    отвечаем без текста, чтобы у кнопки пропали часики.
+
+    Бакеты лежат в OrderedDict в порядке последнего обращения: простаивающие
+    дольше idle_ttl и всё сверх max_buckets удаляются с головы, по несколько
+    штук за вызов.
+
+    exempt — id чатов (например, чатов модераторов); апдейты из них и от
+    пользователей с такими id не ограничиваются.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        exempt: Iterable[int] = (),
+        max_buckets: int = THROTTLE_MAX_BUCKETS,
+        idle_ttl: float = THROTTLE_IDLE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limits = dict(limits or THROTTLE_LIMITS)
+        self.exempt = set(exempt)
+        self.max_buckets = max_buckets
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._buckets: "OrderedDict[Tuple[int, str], _Bucket]" = OrderedDict()
+        self.allowed = dict.fromkeys(self.limits, 0)
+        self.throttled = dict.fromkeys(self.limits, 0)
+        self.evicted = 0
+
+    @staticmethod
+    def classify(event: TelegramObject) -> Optional[str]:
+        if isinstance(event, CallbackQuery):
+            return "callback"
+        if isinstance(event, Message):
+            if event.photo or event.document or event.video:
+                return "media"
+            return "text"
+        return None
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        limit = now - self.idle_ttl
+        for _ in range(2):
+            if not buckets:
+                return
+            key, bucket = next(iter(buckets.items()))
+            if bucket.updated >= limit and len(buckets) <= self.max_buckets:
+                return
+            del buckets[key]
+            self.evicted += 1
+
+    def allow(self, user_id: int, kind: str) -> bool:
+        """Списывает токен, если он есть. O(1) на вызов."""
+        rate, burst = self.limits[kind]
+        now = self._clock()
+        key = (user_id, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(burst, now)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        self._evict(now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return True
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        chat: Optional[Chat] = data.get("event_chat")
+        kind = self.classify(event)
+        if user is None or kind is None or kind not in self.limits or user.id in self.exempt:
+            return await handler(event, data)
+        if chat is not None and chat.id in self.exempt:
+            return await handler(event, data)
+        if self.allow(user.id, kind):
+            self.allowed[kind] += 1
+            return await handler(event, data)
+        self.throttled[kind] += 1
+        logger.debug("Throttled %s update from user %s", kind, user.id)
+        if isinstance(event, CallbackQuery):
+            await event.answer()
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self._buckets),
+            "allowed": dict(self.allowed),
+            "throttled": dict(self.throttled),
+            "evicted": self.evicted,
+        }
+
+
+class UpdateDeduplicationMiddleware(BaseMiddleware):
+    """
+    Outer-middleware Dispatcher.update: отбрасывает апдейт, чей update_id уже
+    был среди последних size. Telegram повторяет доставку вебхука, если ответ
+    не пришёл вовремя, а getUpdates отдаёт апдейты заново, если offset не успел
+    подтвердиться, — без этого повтор снова отправил бы альбом модератору.
+
+    id запоминается до вызова хендлера, так что повтор, пришедший во время
+    обработки оригинала, тоже отбрасывается. Если хендлер упал, id забывается,
+    чтобы повторная доставка обработалась. Набор в памяти процесса.
+    """
+
+    def __init__(self, size: int = UPDATE_DEDUP_SIZE):
+        self.size = size
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self.duplicates = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_id = event.update_id
+        if update_id in self._seen:
+            self.duplicates += 1
+            logger.debug("Dropped duplicate update %s", update_id)
+            return None
+        self._seen[update_id] = None
+        if len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        try:
+            return await handler(event, data)
+        except Exception:
+            self._seen.pop(update_id, None)
+            raise
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._seen), "duplicates": self.duplicates}
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Версионированные миграции users.db.
+
+Текущая версия схемы хранится в таблице schema_version. Миграции применяются
+по порядку, каждая — ровно один раз; при этом сами функции миграций
+идемпотентны (IF NOT EXISTS, проверка колонок), так что прерванный запуск
+можно безопасно повторить. Заполнение новых колонок идёт пачками с коммитом
+после каждой, чтобы не держать блокировку записи и не мешать работающему боту.
+
+Запуск при старте бота — database.init_db(). Отдельно:
+    python migrations.py --db users.db
+    python migrations.py --db users.db --status
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 5000
+BACKFILL_PAUSE = 0.01
+
+
+class Migration:
+    __slots__ = ("version", "name", "apply")
+
+    def __init__(self, version: int, name: str, apply: Callable[[sqlite3.Connection], None]):
+        self.version = version
+        self.name = name
+        self.apply = apply
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Регистрирует функцию как миграцию с номером version."""
+    def decorator(func: Callable[[sqlite3.Connection], None]):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, func))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return decorator
+
+
+def backfill(
+    conn: sqlite3.Connection,
+    table: str,
+    set_sql: str,
+    where_sql: str,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    pause: float = BACKFILL_PAUSE,
+) -> int:
+    """
+    UPDATE table SET set_sql WHERE where_sql пачками по batch_size строк.
+    where_sql должен перестать выполняться для обновлённой строки, иначе цикл не закончится.
+    Возвращает число обновлённых строк.
+    """
+    total = 0
+    while True:
+        cursor = conn.execute(
+            f"UPDATE {table} SET {set_sql} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} WHERE {where_sql} LIMIT ?)",
+            (batch_size,),
+        )
+        conn.commit()
+        if cursor.rowcount <= 0:
+            return total
+        total += cursor.rowcount
+        if pause:
+            time.sleep(pause)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+@migration(1, "users table")
+def _create_users(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE NOT NULL,
+            username TEXT,
+            language TEXT DEFAULT 'en',
+            verification_status INTEGER DEFAULT 0,
+            verification_pending INTEGER DEFAULT 0
+        )
+    ''')
+
+
+@migration(2, "users.username_norm with index")
+def _username_norm(conn: sqlite3.Connection) -> None:
+    if "username_norm" not in _columns(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN username_norm TEXT")
+    norm_sql = "NULLIF(LOWER(LTRIM(TRIM(username), '@')), '')"
+    backfill(
+        conn,
+        "users",
+        f"username_norm = {norm_sql}",
+        f"username_norm IS NULL AND {norm_sql} IS NOT NULL",
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username_norm ON users (username_norm)")
+
+
+@migration(3, "fsm_state table")
+def _fsm_state(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_state (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_expires_at ON fsm_state (expires_at)")
+
+
+@migration(4, "verification_requests table")
+def _verification_requests(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS verification_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            submitted_at REAL NOT NULL,
+            decided_at REAL,
+            decided_by INTEGER
+        )
+    ''')
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verification_requests_status_submitted "
+        "ON verification_requests (status, submitted_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verification_requests_user_status "
+        "ON verification_requests (user_id, status)"
+    )
+    # Заявки, которые до миграции существовали только как users.verification_pending = 1
+    conn.execute('''
+        INSERT INTO verification_requests (user_id, username, status, submitted_at)
+        SELECT u.user_id, u.username, 'pending', ? FROM users u
+        WHERE u.verification_pending = 1 AND NOT EXISTS (
+            SELECT 1 FROM verification_requests r WHERE r.user_id = u.user_id AND r.status = 'pending'
+        )
+    ''', (time.time(),))
+
+
+@migration(5, "verification_requests moderator assignment")
+def _verification_assignment(conn: sqlite3.Connection) -> None:
+    columns = _columns(conn, "verification_requests")
+    if "assigned_to" not in columns:
+        conn.execute("ALTER TABLE verification_requests ADD COLUMN assigned_to INTEGER")
+    if "assigned_at" not in columns:
+        # 0 у заявок без модератора; их без повторной отправки забирает основной чат (moderators.py)
+        conn.execute("ALTER TABLE verification_requests ADD COLUMN assigned_at REAL NOT NULL DEFAULT 0")
+    # Очередь модератора (least-loaded, /pending, статистика)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verification_requests_assigned_status "
+        "ON verification_requests (assigned_to, status)"
+    )
+    # Поиск зависших заявок для переназначения
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verification_requests_status_assigned_at "
+        "ON verification_requests (status, assigned_at)"
+    )
+
+
+@migration(6, "verification_media table")
+def _verification_media(conn: sqlite3.Connection) -> None:
+    # Поиск повторной отправки — одна проверка по первичному ключу file_unique_id;
+    # исход заявки берётся из verification_requests по request_id.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS verification_media (
+            file_unique_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            request_id INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            submitted_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(7, "verification_requests reassignment count")
+def _verification_reassign_count(conn: sqlite3.Connection) -> None:
+    # Сколько раз заявку передавали другому модератору; после предела она остаётся у последнего
+    if "reassign_count" not in _columns(conn, "verification_requests"):
+        conn.execute("ALTER TABLE verification_requests ADD COLUMN reassign_count INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(8, "verification_media request index")
+def _verification_media_request(conn: sqlite3.Connection) -> None:
+    # Файлы заявки для повторной отправки при переназначении
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verification_media_request ON verification_media (request_id)"
+    )
+
+
+def _ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """Применяет все миграции с версией выше текущей (до target включительно). Возвращает применённые версии."""
+    version = current_version(conn)
+    applied = []
+    for m in MIGRATIONS:
+        if m.version <= version or (target is not None and m.version > target):
+            continue
+        logger.info("Applying migration %s: %s", m.version, m.name)
+        started = time.perf_counter()
+        m.apply(conn)
+        conn.execute(
+            "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+            (m.version, m.name, time.time()),
+        )
+        conn.commit()
+        logger.info("Migration %s done in %.2fs", m.version, time.perf_counter() - started)
+        applied.append(m.version)
+    return applied
+
+
+def main(argv=None) -> int:
+    from database import DB_NAME, get_connection
+
+    parser = argparse.ArgumentParser(description="Миграции схемы users.db")
+    parser.add_argument("--db", default=DB_NAME, help="путь к базе (по умолчанию %(default)s)")
+    parser.add_argument("--target", type=int, default=None, help="остановиться на этой версии")
+    parser.add_argument("--status", action="store_true", help="только показать версии")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    conn = get_connection(args.db)
+    conn.execute("PRAGMA journal_mode = WAL")
+    try:
+        version = current_version(conn)
+        if args.status:
+            latest = MIGRATIONS[-1].version if MIGRATIONS else 0
+            print(f"current: {version}, latest: {latest}")
+            for m in MIGRATIONS:
+                print(f"  [{'x' if m.version <= version else ' '}] {m.version} {m.name}")
+            return 0
+        applied = migrate(conn, args.target)
+        print(f"applied: {applied or 'nothing'}, version: {current_version(conn)}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
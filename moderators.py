@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Пул модераторов и распределение заявок на верификацию между ними.
+
+Один чат модератора упирается и в лимиты Telegram на чат, и в скорость одного
+человека. Заявка назначается одному модератору пула: least_loaded — тому, у
+кого меньше всего открытых заявок, round_robin — по кругу. Назначение хранится
+в verification_requests (assigned_to, assigned_at), поэтому переживает рестарт
+и видно всем процессам бота. run_reassign() раз в interval секунд передаёт
+заявки, оставшиеся без решения дольше review_timeout, другому модератору —
+не больше max_reassignments раз на заявку; в пуле из одного чата заявки
+остаются на месте. Заявки, поданные до пула (без модератора), при запуске
+молча закрепляются за основным чатом: их карточки уже там.
+
+Настройка через окружение:
+    MODERATOR_CHAT_IDS="id1,id2,..."  — чаты модераторов, первый — основной
+    MODERATOR_ASSIGNMENT=least_loaded|round_robin
+    MODERATOR_REVIEW_TIMEOUT=3600      — секунд до переназначения
+    MODERATOR_MAX_REASSIGNMENTS=3      — сколько раз одну заявку можно передать
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Iterator, List, Optional, Sequence, Tuple
+
+import async_db
+import database
+
+logger = logging.getLogger(__name__)
+
+ASSIGNMENT = database.ASSIGN_LEAST_LOADED
+REVIEW_TIMEOUT = 3600.0
+REASSIGN_INTERVAL = 60.0
+REASSIGN_BATCH_SIZE = 100
+MAX_REASSIGNMENTS = 3
+# Окно статистики времени до решения
+STATS_WINDOW = 24 * 60 * 60.0
+
+# (модератор, user_id, username, файлы заявки) -> отправка файлов и карточки заявки
+ReassignNotify = Callable[[int, int, Optional[str], List[database.MediaRecord]], Awaitable[None]]
+
+
+class ModeratorPool:
+    def __init__(
+        self,
+        chat_ids: Sequence[int],
+        strategy: str = ASSIGNMENT,
+        review_timeout: float = REVIEW_TIMEOUT,
+        max_reassignments: int = MAX_REASSIGNMENTS,
+    ):
+        if not chat_ids:
+            raise ValueError("Moderator pool is empty")
+        if strategy not in (database.ASSIGN_LEAST_LOADED, database.ASSIGN_ROUND_ROBIN):
+            raise ValueError(f"Unknown moderator assignment strategy {strategy!r}")
+        self.chat_ids = tuple(dict.fromkeys(chat_ids))
+        self.strategy = strategy
+        self.review_timeout = review_timeout
+        self.max_reassignments = max_reassignments
+        self.reassigned = 0
+
+    @classmethod
+    def from_env(cls, default: Sequence[int]) -> "ModeratorPool":
+        raw = os.environ.get("MODERATOR_CHAT_IDS", "")
+        chat_ids = [int(x) for x in raw.split(",") if x.strip()] or list(default)
+        return cls(
+            chat_ids,
+            strategy=os.environ.get("MODERATOR_ASSIGNMENT", ASSIGNMENT),
+            review_timeout=float(os.environ.get("MODERATOR_REVIEW_TIMEOUT", REVIEW_TIMEOUT)),
+            max_reassignments=int(os.environ.get("MODERATOR_MAX_REASSIGNMENTS", MAX_REASSIGNMENTS)),
+        )
+
+    @property
+    def primary(self) -> int:
+        """Основной чат: служебные сообщения, не привязанные к заявке."""
+        return self.chat_ids[0]
+
+    def __contains__(self, chat_id: object) -> bool:
+        return chat_id in self.chat_ids
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.chat_ids)
+
+    def __len__(self) -> int:
+        return len(self.chat_ids)
+
+    async def assign(self, user_id: int, username: Optional[str]) -> Tuple[int, int, bool]:
+        """
+        Ставит заявку в очередь; возвращает (id заявки, чат модератора, которому её отправить,
+        создана ли заявка сейчас — только такую можно снять, если отправка не удалась).
+        """
+        return await async_db.submit_verification_request(user_id, username, self.chat_ids, self.strategy)
+
+    async def reassign_stale(self, notify: ReassignNotify, limit: int = REASSIGN_BATCH_SIZE) -> int:
+        """Переназначает зависшие заявки и отправляет их новым модераторам."""
+        reassigned = await async_db.reassign_stale_verifications(
+            self.chat_ids, self.review_timeout, self.strategy, limit, self.max_reassignments,
+        )
+        for request_id, user_id, username, previous, moderator in reassigned:
+            logger.info("Verification of %s reassigned from %s to %s", user_id, previous, moderator)
+            try:
+                # Прежний чат новому модератору недоступен — файлы отправляются заново по file_id
+                media = await async_db.list_request_media(request_id)
+                await notify(moderator, user_id, username, media)
+            except Exception:
+                logger.exception("Failed to send reassigned verification of %s to %s", user_id, moderator)
+        self.reassigned += len(reassigned)
+        return len(reassigned)
+
+    async def run_reassign(self, notify: ReassignNotify, interval: float = REASSIGN_INTERVAL) -> None:
+        """Периодическое переназначение; запускается задачей из bot.py."""
+        try:
+            adopted = await async_db.adopt_unassigned_verifications(self.primary)
+            if adopted:
+                logger.info("%s unassigned verifications kept in chat %s", adopted, self.primary)
+        except Exception:
+            logger.exception("Failed to adopt unassigned verifications")
+        while True:
+            try:
+                # Полная пачка — возможно, есть ещё: не ждём interval
+                while await self.reassign_stale(notify) >= REASSIGN_BATCH_SIZE:
+                    pass
+            except Exception:
+                logger.exception("Verification reassignment failed")
+            await asyncio.sleep(interval)
+
+    async def stats(self) -> dict:
+        per_moderator = await async_db.moderator_stats(time.time() - STATS_WINDOW)
+        open_, decided, decision_seconds = {}, {}, {}
+        for chat_id in self.chat_ids:
+            count, done, seconds = per_moderator.get(chat_id, (0, 0, None))
+            open_[str(chat_id)] = count
+            decided[str(chat_id)] = done
+            decision_seconds[str(chat_id)] = round(seconds, 1) if seconds is not None else 0.0
+        return {
+            "open": open_,
+            "decided": decided,
+            "decision_seconds": decision_seconds,
+            "reassigned": self.reassigned,
+        }
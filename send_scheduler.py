@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик исходящих запросов к Bot API.
+
+SendScheduler — request-middleware сессии aiogram (bot.session.middleware(...)),
+поэтому через него проходят все вызовы bot.send_message, send_media_group,
+copy_to, edit_text и т.д., включая фоновые задачи. Для методов с chat_id он:
+
+- ждёт токен в бакете чата (личные чаты ~1 сообщение/с, группы ~20/мин);
+- ждёт токен в глобальном бакете (~30 сообщений/с на бота), причём ответы
+  пользователям обслуживаются раньше трафика в чаты модераторов
+  (low_priority_chats);
+- при 429 (TelegramRetryAfter) блокирует чат на retry_after и повторяет запрос.
+
+Время ожидания и глубина очереди доступны через stats(). Часы подменяются
+(clock), а сам middleware работает с любой сессией, в том числе фейковой.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Iterable, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, SendMediaGroup, TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+PRIVATE_CHAT_BURST = 3
+GROUP_CHAT_RATE = 20 / 60
+GROUP_CHAT_BURST = 5
+MAX_RETRIES = 3
+MAX_CHAT_BUCKETS = 10_000
+WAIT_SAMPLES = 1000
+DELAY_THRESHOLD = 0.001
+# Методы, которые не расходуют лимит отправки сообщений.
+UNLIMITED_METHODS = frozenset({"answerCallbackQuery", "deleteMessage", "sendChatAction", "getChat", "getUpdates"})
+
+PRIORITY_USER = 0
+PRIORITY_MODERATOR = 1
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, n: float, now: float) -> float:
+        """Через сколько секунд будет n токенов (без списания)."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, n: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= n
+
+    def reserve(self, n: float, now: float) -> float:
+        """Списывает n токенов в долг и возвращает, сколько ждать. Очередь внутри бакета — FIFO."""
+        self._refill(now)
+        self.tokens -= n
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds: float, now: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(
+        self,
+        low_priority_chats: Iterable[int] = (),
+        global_rate: float = GLOBAL_RATE,
+        max_retries: int = MAX_RETRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.low_priority_chats = set(low_priority_chats)
+        self.max_retries = max_retries
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chats: "OrderedDict[object, TokenBucket]" = OrderedDict()
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._waiting_chat = 0
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.requests = 0
+        self.delayed = 0
+        self.retries = 0
+        self.retry_after_total = 0.0
+
+    def priority_for(self, chat_id) -> int:
+        return PRIORITY_MODERATOR if chat_id in self.low_priority_chats else PRIORITY_USER
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST, self._clock())
+            else:
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST, self._clock())
+            self._chats[chat_id] = bucket
+            while len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire_chat(self, chat_id, weight: int) -> None:
+        wait = self._chat_bucket(chat_id).reserve(weight, self._clock())
+        if wait > 0:
+            self._waiting_chat += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._waiting_chat -= 1
+
+    async def _acquire_global(self, priority: int, weight: int) -> None:
+        now = self._clock()
+        if not self._heap and self._global.delay(weight, now) <= 0:
+            self._global.consume(weight, now)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), weight, future))
+        self._wakeup.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        """Выдаёт глобальные токены ожидающим в порядке приоритета."""
+        while self._heap:
+            priority, _, weight, future = self._heap[0]
+            if future.done():
+                heapq.heappop(self._heap)
+                continue
+            now = self._clock()
+            delay = self._global.delay(weight, now)
+            if delay <= 0:
+                self._global.consume(weight, now)
+                heapq.heappop(self._heap)
+                future.set_result(None)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot,
+        method: TelegramMethod,
+    ) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or method.__api_method__ in UNLIMITED_METHODS:
+            return await make_request(bot, method)
+
+        weight = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        priority = self.priority_for(chat_id)
+        self.requests += 1
+        attempt = 0
+        while True:
+            started = self._clock()
+            await self._acquire_chat(chat_id, weight)
+            await self._acquire_global(priority, weight)
+            waited = self._clock() - started
+            self._waits.append(waited)
+            if waited >= DELAY_THRESHOLD:
+                self.delayed += 1
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.retries += 1
+                self.retry_after_total += e.retry_after
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    "429 on %s in chat %s, retry %s/%s after %ss",
+                    method.__api_method__, chat_id, attempt, self.max_retries, e.retry_after,
+                )
+                self._chat_bucket(chat_id).block(e.retry_after, self._clock())
+
+    def queue_depth(self) -> int:
+        return self._waiting_chat + sum(1 for *_, future in self._heap if not future.done())
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def pct(q: float) -> float:
+            return waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+
+        return {
+            "queue_depth": self.queue_depth(),
+            "requests": self.requests,
+            "delayed": self.delayed,
+            "retries": self.retries,
+            "retry_after_total": self.retry_after_total,
+            "wait_p50": pct(0.50),
+            "wait_p99": pct(0.99),
+            "wait_max": waits[-1] if waits else 0.0,
+        }
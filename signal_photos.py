@@ -6,90 +6,339 @@
 в upload_chat_id (например, чат модератора), file_id сохраняются в signal_file_ids.json.
 Дальше отправка идёт по file_id без повторной загрузки.
 
+Ассеты не захардкожены: любой файл assets/bot_<ключ>.<расширение> становится
+ассетом с ключом <ключ> (bot_buy.jpg → "buy"). file_id хранятся в памяти
+(MediaRegistry): файл читается один раз и перечитывается, только если изменился
+его mtime (проверка не чаще раза в CHECK_INTERVAL секунд) или по refresh().
+Запись атомарная — через временный файл и rename, поэтому падение посреди
+сохранения не портит signal_file_ids.json.
+
+Рядом с file_id хранится sha256 содержимого файла: {"buy": {"file_id": ..., "sha256": ...}}.
+ensure_signal_photos перезаливает только ассеты, у которых изменился хэш (или
+его ещё нет — так старый формат файла с голыми file_id перезальётся один раз),
+загрузки идут параллельно, а манифест записывается один раз в конце.
+
+send_asset_photo() отправляет ассет по file_id и сам лечит кэш: если Telegram
+отвечает, что file_id недействителен, файл перезаливается один раз (остальные
+запросы того же ассета ждут эту же загрузку), реестр обновляется, отправка
+повторяется.
+
 Риски file_id:
 - Обычно file_id постоянен для одного бота и не удаляется Telegram.
 - Может стать недействительным при смене токена бота (новый бот).
 - В очень редких случаях Telegram может инвалидировать старые файлы.
 Рекомендация: хранить signal_file_ids.json в бэкапах; при смене бота — перезалить картинки.
 """
+import asyncio
+import hashlib
 import json
+import logging
 import os
+import tempfile
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, List, Mapping, Optional
 
 from aiogram import Bot
-from aiogram.types import FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+logger = logging.getLogger(__name__)
 
 PROJECT_ROOT = Path(__file__).resolve().parent
-IDS_PATH = PROJECT_ROOT / "signal_file_ids.json"
+IDS_PATH = Path(os.environ.get("SIGNAL_FILE_IDS_PATH") or PROJECT_ROOT / "signal_file_ids.json")
 ASSETS_DIR = PROJECT_ROOT / "assets"
 EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
-BUY_NAME = "bot_buy"
-SELL_NAME = "bot_sell"
-WELCOME_NAME = "bot_welcome"
+ASSET_PREFIX = "bot_"
+CHECK_INTERVAL = 5.0
+UPLOAD_CONCURRENCY = 4
+# Фрагменты ответов Bot API, означающие, что file_id больше не годится. Только
+# конкретные формулировки: прочие BadRequest с "file_id" в тексте (например, ошибки
+# подписи или разметки) не должны вызывать перезаливку.
+INVALID_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference expired",
+    "file_reference_expired",
+    "invalid file id",
+    "invalid file_id",
+    "file_id_invalid",
+)
+
+
+def _atomic_write_json(path: Path, data: dict) -> None:
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class MediaRegistry:
+    """Ключ ассета → file_id в памяти, с подгрузкой из JSON-файла по mtime."""
+
+    def __init__(self, path: Path, check_interval: float = CHECK_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._ids: Dict[str, Optional[str]] = {}
+        self._hashes: Dict[str, Optional[str]] = {}
+        self._mtime: Optional[int] = None
+        self._loaded = False
+        self._next_check = 0.0
+        self.loads = 0
+
+    def _stat_mtime(self) -> Optional[int]:
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self) -> None:
+        """Перечитывает файл. Битый или отсутствующий файл даёт пустой реестр."""
+        mtime = self._stat_mtime()
+        ids: Dict[str, Optional[str]] = {}
+        hashes: Dict[str, Optional[str]] = {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for key, value in data.items():
+                    if isinstance(value, dict):
+                        ids[str(key)] = value.get("file_id") or None
+                        hashes[str(key)] = value.get("sha256") or None
+                    else:
+                        ids[str(key)] = value or None
+                        hashes[str(key)] = None
+            except Exception:
+                logger.exception("Failed to read %s", self.path)
+        self._ids = ids
+        self._hashes = hashes
+        self._mtime = mtime
+        self._loaded = True
+        self._next_check = self._clock() + self.check_interval
+        self.loads += 1
+
+    def _ensure_fresh(self) -> None:
+        if not self._loaded:
+            self.refresh()
+            return
+        now = self._clock()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        if self._stat_mtime() != self._mtime:
+            self.refresh()
+
+    def get(self, key: str) -> Optional[str]:
+        self._ensure_fresh()
+        return self._ids.get(key)
+
+    def hash_of(self, key: str) -> Optional[str]:
+        """sha256 файла, из которого получен file_id ключа, или None (неизвестен)."""
+        self._ensure_fresh()
+        return self._hashes.get(key)
+
+    def all(self) -> Dict[str, Optional[str]]:
+        self._ensure_fresh()
+        return dict(self._ids)
+
+    def update(self, ids: Mapping[str, Optional[str]], hashes: Optional[Mapping[str, Optional[str]]] = None) -> None:
+        """Обновляет file_id (и хэши содержимого) и атомарно сохраняет файл."""
+        self._ensure_fresh()
+        merged_ids = dict(self._ids)
+        merged_ids.update(ids)
+        merged_hashes = dict(self._hashes)
+        for key in ids:
+            merged_hashes[key] = (hashes or {}).get(key)
+        _atomic_write_json(
+            self.path,
+            {key: {"file_id": merged_ids[key], "sha256": merged_hashes.get(key)} for key in merged_ids},
+        )
+        self._ids = merged_ids
+        self._hashes = merged_hashes
+        self._mtime = self._stat_mtime()
+
+    def set(self, key: str, file_id: Optional[str], sha256: Optional[str] = None) -> None:
+        self.update({key: file_id}, {key: sha256})
+
+
+registry = MediaRegistry(IDS_PATH)
 
 
 def load_signal_file_ids() -> dict[str, Optional[str]]:
-    """Читает сохранённые file_id из signal_file_ids.json."""
-    out = {"buy": None, "sell": None}
-    if not IDS_PATH.is_file():
+    """Читает сохранённые file_id (из памяти; файл перечитывается только при изменении)."""
+    return registry.all()
+
+
+def save_signal_file_ids(ids: Mapping[str, Optional[str]]) -> None:
+    """Сохраняет file_id в signal_file_ids.json."""
+    registry.update(ids)
+
+
+def get_file_id(key: str) -> Optional[str]:
+    """file_id ассета по ключу ("buy", "sell", "welcome", ...) или None."""
+    return registry.get(key)
+
+
+def discover_assets() -> Dict[str, Path]:
+    """Все ассеты из assets/: ключ (имя без bot_ и расширения) → путь."""
+    out: Dict[str, Path] = {}
+    if not ASSETS_DIR.is_dir():
         return out
-    try:
-        with open(IDS_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        out["buy"] = data.get("buy") or None
-        out["sell"] = data.get("sell") or None
-        out["welcome"] = data.get("welcome") or None
-    except Exception:
-        pass
+    for p in sorted(ASSETS_DIR.iterdir()):
+        if p.is_file() and p.stem.startswith(ASSET_PREFIX) and p.suffix.lower() in EXTENSIONS:
+            out.setdefault(p.stem[len(ASSET_PREFIX):], p)
     return out
 
 
-def save_signal_file_ids(buy: Optional[str], sell: Optional[str], welcome: Optional[str]) -> None:
-    """Сохраняет file_id в signal_file_ids.json."""
-    data = {"buy": buy, "sell": sell, "welcome": welcome}
-    with open(IDS_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
 
+_upload_chat_id: Optional[int] = None
+_reuploads: Dict[str, "asyncio.Task[Optional[str]]"] = {}
+reupload_count = 0
 
-def _find_asset(name: str) -> Optional[Path]:
-    for ext in EXTENSIONS:
-        p = ASSETS_DIR / f"{name}{ext}"
-        if p.is_file():
-            return p
-    return None
 
+async def upload_asset(bot: Bot, upload_chat_id: int, path: Path) -> str:
+    """Заливает файл в upload_chat_id и возвращает file_id самого большого размера фото."""
+    msg = await bot.send_photo(upload_chat_id, photo=FSInputFile(path))
+    return msg.photo[-1].file_id
 
-async def ensure_signal_photos(bot: Bot, upload_chat_id: int) -> dict[str, Optional[str]]:
+
+async def ensure_signal_photos(
+    bot: Bot, upload_chat_id: int, concurrency: int = UPLOAD_CONCURRENCY
+) -> dict[str, Optional[str]]:
     """
-    Убеждается, что для buy/sell есть file_id. Если нет — заливает файлы из assets/
-    в upload_chat_id и сохраняет file_id. Возвращает {"buy": file_id, "sell": file_id}.
+    Убеждается, что для каждого ассета из assets/ есть актуальный file_id. Новые и изменённые
+    (по sha256) файлы заливаются в upload_chat_id параллельно, не больше concurrency за раз;
+    одинаковые по содержимому файлы заливаются один раз. Манифест сохраняется одной записью.
+    Возвращает {ключ: file_id}.
     """
-    ids = load_signal_file_ids()
+    assets = discover_assets()
+    hashes = await asyncio.to_thread(lambda: {key: _file_hash(path) for key, path in assets.items()})
 
-    for key, name in [("buy", BUY_NAME), ("sell", SELL_NAME), ("welcome", WELCOME_NAME)]:
-        if ids.get(key):
-            continue
-        path = _find_asset(name)
-        if not path:
+    known: Dict[str, str] = {}
+    for key in registry.all():
+        digest, file_id = registry.hash_of(key), registry.get(key)
+        if digest and file_id:
+            known[digest] = file_id
+
+    new_ids: Dict[str, Optional[str]] = {}
+    new_hashes: Dict[str, Optional[str]] = {}
+    to_upload: Dict[str, List[str]] = {}
+    for key, digest in hashes.items():
+        if registry.get(key) and registry.hash_of(key) == digest:
             continue
-        try:
-            photo = FSInputFile(path)
-            msg = await bot.send_photo(upload_chat_id, photo=photo)
-            file_id = msg.photo[-1].file_id
-            ids[key] = file_id
-            save_signal_file_ids(ids.get("buy"), ids.get("sell"), ids.get("welcome"))
-        except Exception:
-            pass
+        if digest in known:
+            new_ids[key], new_hashes[key] = known[digest], digest
+        else:
+            to_upload.setdefault(digest, []).append(key)
+
+    global _upload_chat_id
+    _upload_chat_id = upload_chat_id
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(digest: str, keys: List[str]) -> None:
+        path = assets[keys[0]]
+        async with semaphore:
+            try:
+                file_id = await upload_asset(bot, upload_chat_id, path)
+            except Exception:
+                logger.exception("Failed to upload %s", path)
+                return
+        for key in keys:
+            new_ids[key], new_hashes[key] = file_id, digest
+        logger.info("Uploaded %s as %s", path.name, ", ".join(keys))
+
+    await asyncio.gather(*(upload(digest, keys) for digest, keys in to_upload.items()))
 
+    if new_ids:
+        registry.update(new_ids, new_hashes)
     return load_signal_file_ids()
 
 
+SIGNAL_ASSETS = {"HIGHER": "buy", "LOWER": "sell"}
+
+
 def get_signal_photo_file_id(signal_direction: str) -> Optional[str]:
     """По направлению сигнала ('HIGHER' = buy, 'LOWER' = sell) возвращает file_id или None."""
-    ids = load_signal_file_ids()
-    if signal_direction == "HIGHER":
-        return ids.get("buy")
-    if signal_direction == "LOWER":
-        return ids.get("sell")
-    return None
+    key = SIGNAL_ASSETS.get(signal_direction)
+    return get_file_id(key) if key else None
+
+
+def _is_invalid_file_id(error: TelegramBadRequest) -> bool:
+    text = (error.message or "").lower()
+    return any(fragment in text for fragment in INVALID_FILE_ID_ERRORS)
+
+
+async def _reupload(bot: Bot, key: str) -> Optional[str]:
+    global reupload_count
+    path = discover_assets().get(key)
+    if path is None or _upload_chat_id is None:
+        logger.error("Cannot re-upload asset %r: no file or upload chat", key)
+        return None
+    try:
+        digest = await asyncio.to_thread(_file_hash, path)
+        file_id = await upload_asset(bot, _upload_chat_id, path)
+        registry.set(key, file_id, digest)
+    except Exception:
+        logger.exception("Failed to re-upload asset %r from %s", key, path.name)
+        return None
+    reupload_count += 1
+    logger.warning("Re-uploaded asset %r from %s", key, path.name)
+    return file_id
+
+
+async def reupload(bot: Bot, key: str, stale_file_id: Optional[str] = None) -> Optional[str]:
+    """
+    Перезаливает ассет и возвращает новый file_id. Одновременные вызовы для одного ключа
+    ждут одну и ту же загрузку. Если file_id в реестре уже отличается от stale_file_id,
+    его кто-то обновил — он и возвращается без загрузки.
+    """
+    task = _reuploads.get(key)
+    if task is None:
+        current = registry.get(key)
+        if current and current != stale_file_id:
+            return current
+        task = asyncio.ensure_future(_reupload(bot, key))
+        _reuploads[key] = task
+        task.add_done_callback(lambda _: _reuploads.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def send_asset_photo(bot: Bot, chat_id: int, key: str, **kwargs) -> Optional[Message]:
+    """
+    Отправляет ассет key в chat_id по закэшированному file_id. Недействительный file_id
+    перезаливается (один раз на все конкурентные запросы) и отправка повторяется.
+    Возвращает None, если ассет отправить не удалось (нет file_id и файла или чата
+    для загрузки, загрузка упала) — вызывающий отправляет текст без картинки.
+    """
+    file_id = registry.get(key)
+    if file_id is None:
+        file_id = await reupload(bot, key)
+        if file_id is None:
+            return None
+    try:
+        return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+    except TelegramBadRequest as e:
+        if not _is_invalid_file_id(e):
+            raise
+        logger.warning("file_id of asset %r rejected by Telegram: %s", key, e.message)
+        fresh = await reupload(bot, key, stale_file_id=file_id)
+        if fresh is None or fresh == file_id:
+            return None
+        return await bot.send_photo(chat_id, photo=fresh, **kwargs)
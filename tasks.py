@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновые задачи хендлеров под присмотром.
+
+asyncio держит на задачи только слабые ссылки, поэтому create_task без
+сохранения результата может быть собран GC посреди работы, а исключение из
+такой задачи теряется. TaskSupervisor хранит ссылки на все задачи, пропускает
+одновременно не больше limit (остальные ждут в очереди), логирует и считает
+ошибки, а при остановке бота дожидается задач (drain) и отменяет оставшиеся
+по таймауту.
+
+spawn() ставит задачу без ожидания; submit() ждёт, пока очередь меньше
+max_queued, — так источник задач притормаживает, если исполнение не успевает.
+"""
+import asyncio
+import functools
+import logging
+from collections import deque
+from typing import Any, Coroutine, Deque, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = 8
+MAX_QUEUED = 1000
+DRAIN_TIMEOUT = 20.0
+
+
+class TaskSupervisor:
+    def __init__(self, name: str, limit: int = CONCURRENCY, max_queued: int = MAX_QUEUED):
+        self.name = name
+        self.limit = limit
+        self.max_queued = max_queued
+        self._slots = asyncio.Semaphore(limit)
+        self._tasks: Set[asyncio.Task] = set()
+        self._queue_waiters: Deque[asyncio.Future] = deque()
+        self._closed = False
+        self.active = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    @property
+    def queued(self) -> int:
+        """Задачи, ждущие свободного слота."""
+        return len(self._tasks) - self.active
+
+    async def _run(self, coro: Coroutine) -> Any:
+        await self._slots.acquire()
+        self.active += 1
+        self._wake_submitter()
+        self.started += 1
+        try:
+            return await coro
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def _wake_submitter(self) -> None:
+        while self._queue_waiters:
+            waiter = self._queue_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _done(self, coro: Coroutine, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        # Задача, отменённая до старта, не запускала корутину — закрываем её без предупреждения "never awaited"
+        coro.close()
+        self._wake_submitter()
+        if task.cancelled():
+            self.cancelled += 1
+            return
+        error = task.exception()
+        if error is None:
+            self.completed += 1
+            return
+        self.failed += 1
+        logger.error("Background task %s failed", task.get_name(), exc_info=error)
+
+    def spawn(self, coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+        """Ставит корутину в очередь и сразу возвращает задачу."""
+        if self._closed:
+            coro.close()
+            raise RuntimeError(f"TaskSupervisor {self.name} is closed")
+        task_name = f"{self.name}:{name or getattr(coro, '__qualname__', 'task')}"
+        task = asyncio.ensure_future(self._run(coro))
+        task.set_name(task_name)
+        self._tasks.add(task)
+        task.add_done_callback(functools.partial(self._done, coro))
+        return task
+
+    async def submit(self, coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+        """Как spawn(), но сначала ждёт, пока в очереди станет меньше max_queued задач."""
+        while self.queued >= self.max_queued:
+            waiter = asyncio.get_running_loop().create_future()
+            self._queue_waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                coro.close()
+                raise
+        return self.spawn(coro, name)
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """Больше не принимает задачи, ждёт текущие до timeout секунд и отменяет оставшиеся."""
+        self._closed = True
+        if not self._tasks:
+            return
+        logger.info("Waiting for %s background tasks of %s", len(self._tasks), self.name)
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning("Cancelling %s background tasks of %s after %ss", len(pending), self.name, timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""AlbumAggregator на фейковых часах: время двигает только тест."""
+import asyncio
+from typing import List, Tuple
+
+from albums import AlbumAggregator, PendingAlbum
+from tasks import TaskSupervisor
+
+
+class FakeClock:
+    """Часы и sleep для AlbumAggregator: sleep просыпается, когда advance() доводит время до срока."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._sleepers: List[Tuple[float, asyncio.Future]] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._sleepers.append((self.now + delay, future))
+        await future
+
+    async def advance(self, seconds: float) -> None:
+        self.now += seconds
+        due = [(wake, f) for wake, f in self._sleepers if wake <= self.now]
+        for entry in due:
+            self._sleepers.remove(entry)
+            if not entry[1].done():
+                entry[1].set_result(None)
+        # Даём проснувшимся задачам дойти до следующего sleep или до on_flush
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+
+def _aggregator(clock: FakeClock, **kwargs) -> Tuple[AlbumAggregator, List[PendingAlbum]]:
+    flushed: List[PendingAlbum] = []
+
+    async def on_flush(album: PendingAlbum) -> None:
+        flushed.append(album)
+
+    params = {"debounce": 1.0, "max_wait": 5.0, "clock": clock, "sleep": clock.sleep}
+    params.update(kwargs)
+    return AlbumAggregator(on_flush, **params), flushed
+
+
+def test_debounce_resets_with_each_item():
+    async def scenario():
+        clock = FakeClock()
+        albums, flushed = _aggregator(clock)
+        albums.add("g1", 1, "a")
+        await clock.advance(0.8)
+        albums.add("g1", 1, "b", caption="caption")
+        await clock.advance(0.8)
+        assert flushed == []  # срок сдвинулся на 0.8 + 1.0
+        await clock.advance(0.3)
+        assert len(flushed) == 1
+        assert flushed[0].items == ["a", "b"]
+        assert flushed[0].caption == "caption"
+        assert len(albums) == 0
+        assert albums.stats()["flushed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_max_wait_forces_flush():
+    async def scenario():
+        clock = FakeClock()
+        albums, flushed = _aggregator(clock, max_items=100)
+        for i in range(10):
+            albums.add("g1", 1, i)
+            await clock.advance(0.5)
+            if clock.now < 5.0:
+                assert flushed == []
+        assert len(flushed) == 1
+        assert flushed[0].items == list(range(10))
+
+    asyncio.run(scenario())
+
+
+def test_per_user_cap():
+    async def scenario():
+        clock = FakeClock()
+        albums, flushed = _aggregator(clock, max_albums_per_user=2)
+        assert albums.add("g1", 1, "a")
+        assert albums.add("g2", 1, "a")
+        assert not albums.add("g3", 1, "a")
+        assert albums.add("g4", 2, "a")
+        assert albums.stats()["rejected"] == 1
+        await clock.advance(1.0)
+        assert sorted(a.group_id for a in flushed) == ["g1", "g2", "g4"]
+        # После отправки лимит пользователя освобождается
+        assert albums.add("g5", 1, "a")
+
+    asyncio.run(scenario())
+
+
+def test_global_cap_and_max_items():
+    async def scenario():
+        clock = FakeClock()
+        albums, _ = _aggregator(clock, max_albums=2, max_items=3)
+        assert albums.add("g1", 1, "a")
+        assert albums.add("g2", 2, "a")
+        assert not albums.add("g3", 3, "a")
+        for item in ("b", "c"):
+            assert albums.add("g1", 1, item)
+        assert not albums.add("g1", 1, "d")
+        assert albums.stats()["rejected"] == 2
+        assert albums.stats()["pending_items"] == 4
+        await albums.flush_all()
+
+    asyncio.run(scenario())
+
+
+def test_ttl_evicts_orphaned_albums():
+    async def scenario():
+        clock = FakeClock()
+        # Отправка не наступит сама: debounce и max_wait больше ttl
+        albums, flushed = _aggregator(clock, debounce=100.0, max_wait=100.0, ttl=10.0)
+        albums.add("g1", 1, "a")
+        task = albums._albums["g1"].task
+        clock.now = 11.0
+        # Новый альбом вычищает просроченные
+        assert albums.add("g2", 1, "a")
+        await asyncio.sleep(0)
+        assert "g1" not in albums._albums
+        assert task.cancelled()
+        assert albums.stats()["evicted"] == 1
+        assert flushed == []
+        await albums.flush_all()
+        assert [a.group_id for a in flushed] == ["g2"]
+
+    asyncio.run(scenario())
+
+
+def test_flush_all_on_shutdown():
+    async def scenario():
+        clock = FakeClock()
+        albums, flushed = _aggregator(clock)
+        albums.add("g1", 1, "a")
+        albums.add("g2", 2, "b")
+        tasks = [a.task for a in albums._albums.values()]
+        await albums.flush_all()
+        assert sorted(a.group_id for a in flushed) == ["g1", "g2"]
+        assert len(albums) == 0
+        await asyncio.sleep(0)
+        assert all(t.cancelled() for t in tasks)
+        # Проснувшийся таймер не отправляет альбом второй раз
+        await clock.advance(10.0)
+        assert len(flushed) == 2
+
+    asyncio.run(scenario())
+
+
+def test_flush_all_waits_for_supervised_delivery_and_counts_errors():
+    async def scenario():
+        clock = FakeClock()
+        delivered = []
+
+        async def on_flush(album: PendingAlbum) -> None:
+            await asyncio.sleep(0)
+            if album.group_id == "bad":
+                raise RuntimeError("send failed")
+            delivered.append(album.group_id)
+
+        supervisor = TaskSupervisor("test", limit=1)
+        albums = AlbumAggregator(on_flush, clock=clock, sleep=clock.sleep, supervisor=supervisor)
+        albums.add("good", 1, "a")
+        albums.add("bad", 2, "a")
+        await albums.flush_all()
+        assert delivered == ["good"]
+        assert albums.stats()["flushed"] == 1
+        assert albums.stats()["errors"] == 1
+        assert supervisor.stats()["completed"] == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Ограниченный LRU-кэш с TTL для профилей пользователей.
+
+Кэш потокобезопасен: к нему обращаются и event loop, и потоки БД из async_db.
+Отсутствующие пользователи тоже кэшируются (значение None), чтобы апдейты от
+незнакомых пользователей не ходили в SQLite каждый раз.
+
+Гонку «чтение из БД / запись / put устаревшего значения» закрывает счётчик
+epoch: читатель запоминает его до SELECT и передаёт в put(), а любая
+инвалидация увеличивает счётчик, и такой put() отбрасывается.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Возвращает (найдено, значение). Значение может быть None — это тоже попадание."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, value: Any, epoch: int) -> bool:
+        """Сохраняет значение, если с момента чтения (epoch) не было инвалидаций."""
+        with self._lock:
+            if epoch != self._epoch:
+                return False
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Счётчики для подбора размера кэша."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
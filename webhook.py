@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Режим вебхука: aiohttp-сервер вместо long polling.
+
+Включается BOT_MODE=webhook, по умолчанию бот по-прежнему работает через
+polling. Настройки:
+
+    WEBHOOK_HOST, WEBHOOK_PORT  — адрес, на котором слушает сервер (0.0.0.0:8080)
+    WEBHOOK_PATH                — путь обработчика (/webhook)
+    WEBHOOK_SECRET              — секрет из заголовка X-Telegram-Bot-Api-Secret-Token (обязателен)
+    WEBHOOK_URL                 — публичный адрес; если задан, при старте вызывается setWebhook
+    WEBHOOK_CONCURRENCY         — сколько апдейтов обрабатывается одновременно (32)
+    WEBHOOK_DRAIN_TIMEOUT       — сколько секунд ждать незавершённые апдейты при остановке (25)
+
+Апдейт подтверждается сразу после того, как для него нашёлся свободный слот;
+пока слотов нет, запрос Telegram ждёт ответа, поэтому новые апдейты не
+копятся в памяти. При остановке сервер перестаёт принимать запросы (Telegram
+повторит их позже, в том числе на другом инстансе) и дожидается уже принятых.
+
+Несколько инстансов могут работать с одной users.db: кэш профилей у каждого
+свой, но флаги верификации перед проверками читаются из БД.
+
+Локально без WEBHOOK_URL можно слать записанные апдейты:
+
+    curl -X POST localhost:8080/webhook -H 'X-Telegram-Bot-Api-Secret-Token: <secret>' \\
+         -H 'Content-Type: application/json' -d @update.json
+"""
+import asyncio
+import logging
+import os
+import signal
+from typing import Any, Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = 32
+DRAIN_TIMEOUT = 25.0
+
+
+class ConcurrentRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler с ограничением числа одновременно обрабатываемых апдейтов и drain()."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+                 concurrency: int = CONCURRENCY, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._draining = False
+        self.waiting = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def _process(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("Failed to process update %s", update.get("update_id"))
+        finally:
+            self._slots.release()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        if self._draining:
+            self._slots.release()
+            self.rejected += 1
+            return web.Response(status=503)
+        task = asyncio.create_task(self._process(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._draining:
+            self.rejected += 1
+            return web.Response(status=503)
+        return await super().handle(request)
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """Перестаёт принимать апдейты и ждёт принятые; по таймауту отменяет оставшиеся."""
+        self._draining = True
+        if not self._tasks:
+            return
+        logger.info("Draining %s webhook updates", len(self._tasks))
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("Cancelled %s updates after %ss drain timeout", len(pending), timeout)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._tasks),
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+async def _wait_for_stop_signal() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except NotImplementedError:
+                pass
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Поднимает aiohttp-сервер, обрабатывает апдейты до SIGINT/SIGTERM и аккуратно останавливается."""
+    host = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+    port = int(os.environ.get("WEBHOOK_PORT", "8080"))
+    path = os.environ.get("WEBHOOK_PATH", "/webhook")
+    secret = os.environ.get("WEBHOOK_SECRET")
+    if not secret:
+        # Без секрета апдейты от кого угодно, кто знает адрес, обрабатывались бы как от Telegram
+        raise RuntimeError("WEBHOOK_SECRET must be set in webhook mode")
+    public_url = os.environ.get("WEBHOOK_URL")
+    concurrency = int(os.environ.get("WEBHOOK_CONCURRENCY", str(CONCURRENCY)))
+    drain_timeout = float(os.environ.get("WEBHOOK_DRAIN_TIMEOUT", str(DRAIN_TIMEOUT)))
+
+    handler = ConcurrentRequestHandler(dp, bot, secret_token=secret, concurrency=concurrency)
+    if metrics.ENABLED:
+        metrics.register_gauges("bot_webhook", handler.stats)
+    app = web.Application()
+    app.router.add_route("POST", path, handler.handle)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+
+    # Те же данные, что передаёт хукам start_polling
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    try:
+        await site.start()
+        if public_url:
+            await bot.set_webhook(
+                public_url.rstrip("/") + path,
+                secret_token=secret,
+                max_connections=min(concurrency, 100),
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        logger.info("Webhook server listening on %s:%s%s (concurrency %s)", host, port, path, concurrency)
+        await _wait_for_stop_signal()
+    finally:
+        await handler.drain(drain_timeout)
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
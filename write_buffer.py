@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind буфер для записей в users.
+
+Повторные записи одного user_id сливаются в одну, а накопленное сбрасывается
+в БД одной транзакцией (один fsync) — по размеру буфера или по таймеру в
+фоновом потоке. Пока запись не сброшена, её видно через overlay(): database.py
+накладывает его на прочитанную строку, поэтому чтение после записи
+согласовано. При остановке (close_db) буфер сбрасывается синхронно.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.5
+MAX_PENDING = 500
+
+
+class PendingWrite:
+    """
+    Несброшенные изменения одного пользователя.
+    upsert — (username, username_norm, language): вставить строку, если её нет, иначе обновить эти поля.
+    fields — колонки для UPDATE, применяются после upsert.
+    """
+
+    __slots__ = ("upsert", "fields")
+
+    def __init__(self):
+        self.upsert: Optional[Tuple[Optional[str], Optional[str], str]] = None
+        self.fields: Dict[str, object] = {}
+
+    def merge(self, other: "PendingWrite") -> None:
+        if other.upsert is not None:
+            self.upsert = other.upsert
+            for column in ("username", "username_norm", "language"):
+                self.fields.pop(column, None)
+        self.fields.update(other.fields)
+
+    def copy(self) -> "PendingWrite":
+        out = PendingWrite()
+        out.upsert = self.upsert
+        out.fields = dict(self.fields)
+        return out
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        flush_fn: Callable[[Dict[int, PendingWrite]], None],
+        interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING,
+    ):
+        self._flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[int, PendingWrite] = {}
+        self._inflight: Dict[int, PendingWrite] = {}
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.errors = 0
+
+    def _put(self, user_id: int, write: PendingWrite) -> None:
+        with self._lock:
+            self.writes += 1
+            current = self._pending.get(user_id)
+            if current is None:
+                self._pending[user_id] = write
+            else:
+                current.merge(write)
+                self.coalesced += 1
+            full = len(self._pending) >= self.max_pending
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def put_upsert(self, user_id: int, username: Optional[str], username_norm: Optional[str], language: str) -> None:
+        write = PendingWrite()
+        write.upsert = (username, username_norm, language)
+        self._put(user_id, write)
+
+    def put_fields(self, user_id: int, **fields) -> None:
+        write = PendingWrite()
+        write.fields = fields
+        self._put(user_id, write)
+
+    def discard(self, user_id: int) -> None:
+        """Отбрасывает несброшенные изменения пользователя (перед прямой перезаписью строки)."""
+        with self._lock:
+            self._pending.pop(user_id, None)
+
+    def discard_fields(self, user_id: int, *fields: str) -> None:
+        """Отбрасывает несброшенные значения колонок fields пользователя (их записали напрямую)."""
+        with self._lock:
+            write = self._pending.get(user_id)
+            if write is None:
+                return
+            for column in fields:
+                write.fields.pop(column, None)
+            if write.upsert is None and not write.fields:
+                del self._pending[user_id]
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """
+        Дожидается текущего сброса и не даёт начаться новому до выхода. Для записи
+        мимо буфера: внутри пишем в БД и вызываем discard_fields(), и устаревшая
+        пачка не перезапишет строку после нашего коммита. Внутри нельзя вызывать flush().
+        """
+        with self._flush_lock:
+            yield
+
+    def overlay(self, user_id: int) -> Optional[PendingWrite]:
+        """Несброшенные изменения пользователя (сбрасываемые сейчас + ожидающие) или None."""
+        with self._lock:
+            inflight = self._inflight.get(user_id)
+            pending = self._pending.get(user_id)
+            if inflight is None and pending is None:
+                return None
+            out = PendingWrite()
+            if inflight is not None:
+                out.merge(inflight)
+            if pending is not None:
+                out.merge(pending)
+            return out
+
+    def flush(self) -> int:
+        """Сбрасывает всё накопленное одной транзакцией. Возвращает число строк."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            try:
+                self._flush_fn(batch)
+            except BaseException:
+                # Возвращаем пачку в буфер, более свежие записи поверх неё.
+                with self._lock:
+                    for user_id, write in self._pending.items():
+                        batch.setdefault(user_id, PendingWrite()).merge(write)
+                    self._pending = batch
+                    self._inflight = {}
+                    self.errors += 1
+                raise
+            with self._lock:
+                self._inflight = {}
+                self.flushes += 1
+                self.rows_flushed += len(batch)
+            return len(batch)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed, will retry")
+
+    def close(self) -> None:
+        """Останавливает фоновый поток и синхронно сбрасывает остаток."""
+        with self._lock:
+            self._stopping = True
+            thread, self._thread = self._thread, None
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+        self.flush()
+        with self._lock:
+            self._stopping = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "writes": self.writes,
+                "coalesced": self.coalesced,
+                "flushes": self.flushes,
+                "rows_flushed": self.rows_flushed,
+                "errors": self.errors,
+            }